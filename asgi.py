@@ -0,0 +1,342 @@
+"""ASGI deployment of the visitor system.
+
+    uvicorn asgi:app --host 0.0.0.0 --port $PORT --workers 4
+
+Visitor registration, host approval and visitor lookups are coroutines: they
+use an async SQLAlchemy engine (aiosqlite / asyncpg) and deliver outbox rows
+with httpx, so a worker keeps serving other requests while it waits on the
+database or a slow webhook. Every other route is the Flask app, run in a
+thread pool by a2wsgi. Both sides share the models, the outbox table and the
+notification channels of ``main``, so sync and async workers can run against
+the same database. Outbox rows created by Flask routes are handed to this
+app's event loop too, so no webhook is sent with blocking requests here.
+"""
+import asyncio
+import contextlib
+import hashlib
+import json
+import os
+import re
+import time
+
+from a2wsgi import WSGIMiddleware
+from flask import Response
+from sqlalchemy import event
+from sqlalchemy.exc import OperationalError
+from sqlalchemy.ext.asyncio import async_sessionmaker, create_async_engine
+from werkzeug.exceptions import NotFound
+from werkzeug.http import parse_etags
+
+import main
+from main import NotificationOutbox, Visitor, VisitorArchive
+from notifications import async_transport_from_env
+
+# Async driver for each database the sync app supports
+ASYNC_DRIVERS = {'sqlite': 'sqlite+aiosqlite', 'postgresql': 'postgresql+asyncpg'}
+
+def async_engine(sync_engine):
+    """Async engine for the database a Flask engine opened.
+
+    Built from the engine's URL rather than the configured string, since
+    Flask-SQLAlchemy resolves a relative SQLite path against the instance
+    folder. Same pool settings, SQLite pragmas and query timing.
+    """
+    dialect = sync_engine.dialect.name
+    if dialect not in ASYNC_DRIVERS:
+        raise RuntimeError(f'No async driver configured for {dialect} databases')
+    engine = create_async_engine(sync_engine.url.set(drivername=ASYNC_DRIVERS[dialect]),
+                                 **main.engine_options_from_env(str(sync_engine.url)))
+    if dialect == 'sqlite':
+        event.listen(engine.sync_engine, 'connect', main._set_sqlite_pragmas)
+    event.listen(engine.sync_engine, 'before_cursor_execute', main._before_cursor_execute)
+    event.listen(engine.sync_engine, 'after_cursor_execute', main._after_cursor_execute)
+    return engine
+
+with main.app.app_context():
+    engine = async_engine(main.db.engine)
+    # Read replica for visitor lookups, as for the Flask app (see main.read_replica)
+    replica_engine = async_engine(main.db.engines['replica']) if main.DATABASE_REPLICA_URL else None
+
+# Values are read after commit (ids, the cached visitor body), so don't expire them
+Session = async_sessionmaker(engine, expire_on_commit=False)
+ReplicaSession = async_sessionmaker(replica_engine, expire_on_commit=False) if replica_engine else None
+
+# SQLite takes one writer at a time, and a connection that finds the database
+# locked backs off in sleeps of up to 100 ms. Queueing this worker's write
+# transactions on the event loop instead keeps them from sleeping on each other.
+write_lock = asyncio.Lock() if engine.dialect.name == 'sqlite' else contextlib.nullcontext()
+
+
+class AsyncOutboxRelay:
+    """Event-loop counterpart of ``main.OutboxRelay``.
+
+    Uses the same claim, backoff and retention rules, so rows can be
+    delivered by any worker, sync or async. At most ``concurrency`` sends are
+    in flight per worker; on shutdown the running ones get ``drain_timeout``
+    seconds to finish and anything left is picked up by a later poll.
+    """
+
+    def __init__(self, relay, concurrency=20, drain_timeout=10.0):
+        self.relay = relay
+        self.concurrency = concurrency
+        self.drain_timeout = drain_timeout
+        self.transport = None
+        self._slots = None
+        self._tasks = set()
+        self._poller = None
+        self._loop = None
+
+    def ensure_started(self):
+        """Start on the running event loop and take over ``main.outbox_relay.kick``"""
+        if self.transport is not None:
+            return
+        self._loop = asyncio.get_running_loop()
+        self.transport = async_transport_from_env()
+        self._slots = asyncio.Semaphore(self.concurrency)
+        self._poller = asyncio.create_task(self._run())
+        self.relay.handoff = self.kick_threadsafe
+
+    def kick_threadsafe(self, outbox_ids):
+        """``kick`` from another thread (Flask routes, the host digest timer)"""
+        self._loop.call_soon_threadsafe(self.kick, list(outbox_ids))
+
+    def kick(self, outbox_ids):
+        """Try the given rows right away, without waiting for the sends"""
+        self.ensure_started()
+        for outbox_id in outbox_ids:
+            task = asyncio.create_task(self.deliver(outbox_id))
+            self._tasks.add(task)
+            task.add_done_callback(self._tasks.discard)
+
+    async def deliver(self, outbox_id):
+        async with self._slots:
+            try:
+                async with write_lock, Session() as session:
+                    claimed = (await session.execute(self.relay.claim(outbox_id))).rowcount
+                    await session.commit()
+                    if not claimed:
+                        return
+                    row = await session.get(NotificationOutbox, outbox_id)
+
+                # No transaction (or write lock) is held while the webhook answers
+                outcome, error = await main.notifiers.send_to_async(
+                    self.transport, row.audience, row.channel, row.message, json.loads(row.payload))
+                async with write_lock, Session() as session:
+                    session.add(row)
+                    self.relay.record(row, outcome, error)
+                    await session.commit()
+            except Exception as e:
+                # The row stays claimed until its lease runs out, then the poller retries it
+                print(f"Async outbox delivery of {outbox_id} failed: {str(e)}")
+
+    async def poll_once(self):
+        """Deliver every row due for (re)delivery and purge old sent rows"""
+        async with write_lock, Session() as session:
+            due = (await session.execute(self.relay.due())).scalars().all()
+            await session.execute(self.relay.purge(), execution_options={'synchronize_session': False})
+            await session.commit()
+        self.kick(due)
+
+    async def _run(self):
+        while True:
+            await asyncio.sleep(self.relay.poll_interval)
+            try:
+                await self.poll_once()
+            except Exception as e:
+                print(f"Async outbox relay poll failed: {str(e)}")
+
+    async def close(self):
+        if self.transport is None:
+            return
+        self._poller.cancel()
+        if self._tasks:
+            done, pending = await asyncio.wait(self._tasks, timeout=self.drain_timeout)
+            if pending:
+                print(f"Async outbox relay stopped with {len(pending)} deliveries in flight")
+        await self.transport.close()
+        self.transport = None
+        # Anything kicked from now on (e.g. digests flushed at exit) goes through the dispatcher
+        self.relay.handoff = None
+
+
+outbox_relay = AsyncOutboxRelay(
+    main.outbox_relay,
+    concurrency=int(os.getenv('ASYNC_NOTIFICATION_CONCURRENCY', 20)),
+    drain_timeout=float(os.getenv('NOTIFICATION_DRAIN_TIMEOUT', 10)),
+)
+
+
+async def read_json(receive):
+    """Request body parsed as JSON (None when empty)"""
+    body = b''
+    while True:
+        message = await receive()
+        body += message.get('body', b'')
+        if not message.get('more_body'):
+            break
+    return json.loads(body) if body else None
+
+def json_response(data, status=200):
+    return Response(main.app.json.dumps(data), status=status, mimetype='application/json')
+
+def not_found():
+    return NotFound().get_response()
+
+def request_header(scope, name):
+    for key, value in scope['headers']:
+        if key == name:
+            return value.decode('latin-1')
+    return None
+
+async def register_visitor(scope, receive):
+    try:
+        data = await read_json(receive)
+
+        # Validate required fields
+        required_fields = ['name', 'phone', 'company', 'host_name', 'host_company', 'host_phone']
+        for field in required_fields:
+            if not data.get(field):
+                return json_response({'error': f'{field} is required'}, 400)
+
+        async with write_lock, Session() as session:
+            visitor = Visitor(
+                name=data['name'],
+                phone=data['phone'],
+                company=data['company'],
+                host_name=data['host_name'],
+                host_company=data['host_company'],
+                host_phone=data['host_phone']
+            )
+            session.add(visitor)
+            await session.flush()
+
+            # Same transaction as the visitor, as in main.register_visitor
+            rows = main.outbox_relay.rows('host', *main.host_notification(visitor), hold=main.HOST_DIGEST_HOLD)
+            session.add_all(rows)
+            await session.flush()
+            await session.execute(main.data_version_bump())
+            await session.commit()
+
+        outbox_ids = [row.id for row in rows]
+        if main.host_digest is not None:
+            main.host_digest.add(visitor.host_phone, (main.detached_copy(visitor), outbox_ids))
+        else:
+            outbox_relay.kick(outbox_ids)
+
+        return json_response({'message': 'Visitor registered successfully', 'id': visitor.id}, 201)
+    except Exception as e:
+        return json_response({'error': str(e)}, 500)
+
+async def update_visitor_status(scope, receive, visitor_id):
+    try:
+        # Read and check the body before taking the write lock, so a slow
+        # client cannot hold up other writes in this worker
+        data = await read_json(receive)
+        new_status = data.get('status')
+
+        async with write_lock, Session() as session:
+            visitor = await session.get(Visitor, visitor_id)
+            if visitor is None:
+                return not_found()
+            if new_status not in ['approved', 'denied']:
+                return json_response({'error': 'Status must be approved or denied'}, 400)
+
+            visitor.status = new_status
+
+            # Security notification goes into the outbox in the same transaction
+            rows = main.outbox_relay.rows('security', *main.security_notification(visitor))
+            session.add_all(rows)
+            await session.flush()
+            await session.execute(main.data_version_bump())
+            body = main.app.json.dumps(visitor.to_dict())
+            await session.commit()
+
+        main.visitor_cache.put(visitor_id, body)
+        outbox_relay.kick([row.id for row in rows])
+
+        return json_response({'message': f'Visitor status updated to {new_status}'})
+    except Exception as e:
+        return json_response({'error': str(e)}, 500)
+
+async def load_visitor(session_factory, visitor_id):
+    async with session_factory() as session:
+        return await session.get(Visitor, visitor_id) or await session.get(VisitorArchive, visitor_id)
+
+async def find_visitor(visitor_id):
+    """A visitor from the replica when it is usable, otherwise (or when not there yet) the primary"""
+    router = main.replica_router
+    if ReplicaSession is not None and router.available():
+        try:
+            visitor = await load_visitor(ReplicaSession, visitor_id)
+            router.record('replica')
+            # None: possibly registered a moment ago and not replicated yet
+            return visitor or await load_visitor(Session, visitor_id)
+        except OperationalError as e:
+            router.mark_down(e)
+    router.record('primary')
+    return await load_visitor(Session, visitor_id)
+
+async def get_visitor(scope, receive, visitor_id):
+    body = main.visitor_cache.get(visitor_id)
+    if body is None:
+        visitor = await find_visitor(visitor_id)
+        if visitor is None:
+            return not_found()
+        body = main.app.json.dumps(visitor.to_dict())
+        main.visitor_cache.put(visitor_id, body)
+
+    etag = hashlib.sha1(body.encode()).hexdigest()
+    if parse_etags(request_header(scope, b'if-none-match')).contains(etag):
+        return main.not_modified(etag)
+    return main.with_etag(Response(body, mimetype='application/json'), etag)
+
+# (method, path pattern, route label for metrics, handler); path groups are visitor ids
+ROUTES = [
+    ('POST', re.compile(r'/api/visitors'), '/api/visitors', register_visitor),
+    ('PUT', re.compile(r'/api/visitors/(\d+)/status'), '/api/visitors/<int:visitor_id>/status',
+     update_visitor_status),
+    ('GET', re.compile(r'/api/visitors/(\d+)'), '/api/visitors/<int:visitor_id>', get_visitor),
+]
+
+# Everything else: the Flask app on a thread pool (long-lived security streams hold a thread each)
+flask_app = WSGIMiddleware(main.app, workers=int(os.getenv('ASGI_WSGI_THREADS', 10)))
+
+async def send_response(send, response):
+    await send({
+        'type': 'http.response.start',
+        'status': response.status_code,
+        'headers': [(name.lower().encode('latin-1'), value.encode('latin-1'))
+                    for name, value in response.headers.to_wsgi_list()],
+    })
+    await send({'type': 'http.response.body', 'body': response.get_data()})
+
+async def lifespan(receive, send):
+    while True:
+        message = await receive()
+        if message['type'] == 'lifespan.startup':
+            outbox_relay.ensure_started()
+            main.visitor_archiver.ensure_started()
+            await send({'type': 'lifespan.startup.complete'})
+        elif message['type'] == 'lifespan.shutdown':
+            await outbox_relay.close()
+            await engine.dispose()
+            if replica_engine is not None:
+                await replica_engine.dispose()
+            await send({'type': 'lifespan.shutdown.complete'})
+            return
+
+async def app(scope, receive, send):
+    if scope['type'] == 'lifespan':
+        return await lifespan(receive, send)
+    if scope['type'] == 'http':
+        # Normally done at lifespan startup; covers servers running without it
+        outbox_relay.ensure_started()
+        for method, pattern, route, handler in ROUTES:
+            match = pattern.fullmatch(scope['path'])
+            if match and scope['method'] == method:
+                started = time.perf_counter()
+                response = await handler(scope, receive, *(int(group) for group in match.groups()))
+                main.request_latency.observe(time.perf_counter() - started,
+                                             method=method, route=route, status=response.status_code)
+                return await send_response(send, response)
+    return await flask_app(scope, receive, send)
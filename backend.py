@@ -4,9 +4,10 @@ from datetime import datetime
 import qrcode
 import io
 import base64
-import requests
 import os
 
+from notifications import registry_from_env, transport_from_env
+
 app = Flask(__name__)
 
 # Configure database - use PostgreSQL in production, SQLite in development
@@ -15,6 +16,10 @@ app.config['SQLALCHEMY_DATABASE_URI'] = DATABASE_URL.replace('postgres://', 'pos
 app.config['SQLALCHEMY_TRACK_MODIFICATIONS'] = False
 db = SQLAlchemy(app)
 
+# Notification channels per audience, built once from NOTIFICATION_SERVICE and
+# SECURITY_NOTIFICATION_SERVICE (shared with main.py)
+notifiers = registry_from_env(transport_from_env())
+
 # Database Models
 class Visitor(db.Model):
     id = db.Column(db.Integer, primary_key=True)
@@ -181,64 +186,19 @@ def register_visitor():
 
 def send_notification_to_host(visitor):
     """Send notification to the host for confirmation via WeChat or DingTalk"""
-    try:
-        # Determine which notification service to use based on environment variable
-        notification_service = os.getenv('NOTIFICATION_SERVICE', 'webhook').lower()
-        
-        message = f'有新的访客预约:\n姓名: {visitor.name}\n电话: {visitor.phone}\n单位: {visitor.company}\n\n请确认是否同意接待，访问ID: {visitor.id}'
-        
-        if notification_service == 'wechat':
-            # WeChat Work notification
-            wechat_webhook = os.getenv('WECHAT_WEBHOOK')
-            if not wechat_webhook:
-                print("WeChat webhook not configured")
-                return
-                
-            payload = {
-                "msgtype": "text",
-                "text": {
-                    "content": message
-                }
-            }
-            response = requests.post(wechat_webhook, json=payload)
-            print(f"WeChat notification sent: {response.status_code}")
-            
-        elif notification_service == 'dingtalk':
-            # DingTalk notification
-            dingtalk_webhook = os.getenv('DINGTALK_WEBHOOK')
-            if not dingtalk_webhook:
-                print("DingTalk webhook not configured")
-                return
-                
-            payload = {
-                "msgtype": "text",
-                "text": {
-                    "content": message
-                }
-            }
-            response = requests.post(dingtalk_webhook, json=payload)
-            print(f"DingTalk notification sent: {response.status_code}")
-            
-        else:
-            # Generic webhook fallback
-            webhook_url = os.getenv('HOST_NOTIFICATION_WEBHOOK', 'https://example.com/webhook')
-            
-            payload = {
-                'text': message,
-                'visitor_id': visitor.id,
-                'visitor_name': visitor.name,
-                'visitor_phone': visitor.phone,
-                'visitor_company': visitor.company,
-                'host_name': visitor.host_name,
-                'host_company': visitor.host_company,
-                'host_phone': visitor.host_phone
-            }
-            
-            response = requests.post(webhook_url, json=payload)
-            print(f"Generic notification sent: {response.status_code}")
-        
-    except Exception as e:
-        print(f"Error sending notification to host: {str(e)}")
+    message = f'有新的访客预约:\n姓名: {visitor.name}\n电话: {visitor.phone}\n单位: {visitor.company}\n\n请确认是否同意接待，访问ID: {visitor.id}'
+    
+    payload = {
+        'text': message,
+        'visitor_id': visitor.id,
+        'visitor_name': visitor.name,
+        'visitor_phone': visitor.phone,
+        'visitor_company': visitor.company,
+        'host_name': visitor.host_name,
+        'host_company': visitor.host_company,
+        'host_phone': visitor.host_phone
+    }
+    notifiers.send('host', message, payload)
 
 # API endpoint for host to approve or deny visitor
 @app.route('/api/visitors/<int:visitor_id>/status', methods=['PUT'])
@@ -264,80 +224,18 @@ def update_visitor_status(visitor_id):
 
 def send_notification_to_security(visitor):
     """Send notification to security app"""
-    try:
-        # Determine which notification service to use for security
-        security_notification_service = os.getenv('SECURITY_NOTIFICATION_SERVICE', 'webhook').lower()
-        
-        message = f'访客状态更新:\n访客姓名: {visitor.name}\n访客电话: {visitor.phone}\n访客单位: {visitor.company}\n被拜访人: {visitor.host_name}\n状态: {visitor.status}\n访客ID: {visitor.id}'
-        
-        if security_notification_service == 'wechat':
-            # WeChat Work notification for security
-            wechat_webhook = os.getenv('SECURITY_WECHAT_WEBHOOK')
-            if not wechat_webhook:
-                print("Security WeChat webhook not configured")
-                return
-                
-            payload = {
-                "msgtype": "text",
-                "text": {
-                    "content": message
-                }
-            }
-            response = requests.post(wechat_webhook, json=payload)
-            print(f"Security WeChat notification sent: {response.status_code}")
-            
-        elif security_notification_service == 'dingtalk':
-            # DingTalk notification for security
-            dingtalk_webhook = os.getenv('SECURITY_DINGTALK_WEBHOOK')
-            if not dingtalk_webhook:
-                print("Security DingTalk webhook not configured")
-                return
-                
-            payload = {
-                "msgtype": "text",
-                "text": {
-                    "content": message
-                }
-            }
-            response = requests.post(dingtalk_webhook, json=payload)
-            print(f"Security DingTalk notification sent: {response.status_code}")
-            
-        elif security_notification_service == 'app':
-            # Direct API call to security app
-            security_app_url = os.getenv('SECURITY_APP_URL', 'http://localhost:5001')
-            
-            payload = {
-                'visitor_name': visitor.name,
-                'visitor_phone': visitor.phone,
-                'visitor_company': visitor.company,
-                'host_name': visitor.host_name,
-                'visit_time': visitor.visit_time.isoformat(),
-                'status': visitor.status,
-                'visitor_id': visitor.id
-            }
-            
-            response = requests.post(f'{security_app_url}/api/security/notifications', json=payload)
-            print(f"Notification sent to security app: {response.status_code}")
-            
-        else:
-            # Generic webhook fallback for security
-            webhook_url = os.getenv('SECURITY_NOTIFICATION_WEBHOOK', 'https://example.com/security_webhook')
-            
-            payload = {
-                'visitor_name': visitor.name,
-                'visitor_phone': visitor.phone,
-                'visitor_company': visitor.company,
-                'host_name': visitor.host_name,
-                'visit_time': visitor.visit_time.isoformat(),
-                'status': visitor.status,
-                'visitor_id': visitor.id
-            }
-            
-            response = requests.post(webhook_url, json=payload)
-            print(f"Security notification sent to webhook: {response.status_code}")
-        
-    except Exception as e:
-        print(f"Error sending notification to security: {str(e)}")
+    message = f'访客状态更新:\n访客姓名: {visitor.name}\n访客电话: {visitor.phone}\n访客单位: {visitor.company}\n被拜访人: {visitor.host_name}\n状态: {visitor.status}\n访客ID: {visitor.id}'
+    
+    payload = {
+        'visitor_name': visitor.name,
+        'visitor_phone': visitor.phone,
+        'visitor_company': visitor.company,
+        'host_name': visitor.host_name,
+        'visit_time': visitor.visit_time.isoformat(),
+        'status': visitor.status,
+        'visitor_id': visitor.id
+    }
+    notifiers.send('security', message, payload)
 
 # API to get all visitors (for admin/security interface)
 @app.route('/api/visitors', methods=['GET'])
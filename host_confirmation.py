@@ -63,10 +63,25 @@ HOST_CONFIRMATION_TEMPLATE = '''
         // Load visitors on page load
         window.onload = loadVisitors;
         
+        // Follow X-Next-Cursor until the last page, so no pending visitor is cut off
+        async function fetchAllPages(query) {
+            const visitors = [];
+            let url = `${BACKEND_URL}/api/visitors?${query}`;
+            while (url) {
+                const response = await fetch(url);
+                visitors.push(...await response.json());
+                const cursor = response.headers.get('X-Next-Cursor');
+                url = cursor ? `${BACKEND_URL}/api/visitors?${query}&cursor=${encodeURIComponent(cursor)}` : null;
+            }
+            return visitors;
+        }
+        
         async function loadVisitors() {
             try {
-                const response = await fetch(`${BACKEND_URL}/api/visitors`);
-                const visitors = await response.json();
+                // Every pending visitor, plus the most recent page for the history
+                const pendingVisitors = await fetchAllPages('status=pending&limit=500');
+                const recent = await (await fetch(`${BACKEND_URL}/api/visitors`)).json();
+                const visitors = pendingVisitors.concat(recent.filter(v => v.status !== 'pending'));
                 
                 const container = document.getElementById('visitorsContainer');
                 container.innerHTML = '';
@@ -76,8 +91,7 @@ HOST_CONFIRMATION_TEMPLATE = '''
                     return;
                 }
                 
-                visitors.forEach(visitor => {
-                    if (visitor.status !== 'pending') return; // Only show pending requests
+                pendingVisitors.forEach(visitor => {
                     
                     const card = document.createElement('div');
                     card.className = `visitor-card ${visitor.status}`;
@@ -102,7 +116,7 @@ HOST_CONFIRMATION_TEMPLATE = '''
                 const nonPendingVisitors = visitors.filter(v => v.status !== 'pending');
                 if (nonPendingVisitors.length > 0) {
                     const historyTitle = document.createElement('h3');
-                    historyTitle.textContent = '历史记录';
+                    historyTitle.textContent = '最近的历史记录';
                     container.appendChild(historyTitle);
                     
                     nonPendingVisitors.forEach(visitor => {
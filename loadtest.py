@@ -0,0 +1,281 @@
+"""Load test for the visitor system.
+
+Boots ``main:app`` under gunicorn (or ``asgi:app`` under uvicorn) against a
+temporary SQLite database, points every notification channel at a local fake
+webhook server, drives concurrent register -> approve -> security feed flows
+and reports throughput and p50/p95/p99 latency per endpoint.
+
+    python loadtest.py --flows 500 --concurrency 20 --workers 4
+    python loadtest.py --webhook-latency 0.5 --webhook-failure-rate 0.1
+    python loadtest.py --max-p95-ms 200   # exit 1 if any endpoint is slower
+    python loadtest.py --server async     # uvicorn asgi:app instead
+    python loadtest.py --server compare --scenario register --workers 4
+"""
+import argparse
+import json
+import math
+import os
+import random
+import socket
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from collections import defaultdict
+from concurrent.futures import ThreadPoolExecutor
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import requests
+
+
+class FakeWebhookHandler(BaseHTTPRequestHandler):
+    """Stands in for WeChat Work, DingTalk and the generic webhooks"""
+
+    def do_POST(self):
+        self.rfile.read(int(self.headers.get('Content-Length', 0)))
+        server = self.server
+        time.sleep(server.latency)
+        with server.lock:
+            server.received[self.path] += 1
+        if random.random() < server.failure_rate:
+            with server.lock:
+                server.failed += 1
+            self._reply(500, {'errcode': 500, 'errmsg': 'injected failure'})
+        else:
+            self._reply(200, {'errcode': 0, 'errmsg': 'ok'})
+
+    def _reply(self, status, body):
+        data = json.dumps(body).encode()
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def log_message(self, format, *args):
+        pass
+
+
+def start_fake_webhook(latency, failure_rate):
+    server = ThreadingHTTPServer(('127.0.0.1', 0), FakeWebhookHandler)
+    server.daemon_threads = True
+    server.latency = latency
+    server.failure_rate = failure_rate
+    server.received = defaultdict(int)
+    server.failed = 0
+    server.lock = threading.Lock()
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
+
+
+def free_port():
+    with socket.socket() as sock:
+        sock.bind(('127.0.0.1', 0))
+        return sock.getsockname()[1]
+
+
+def start_app(args, server, webhook_url, workdir):
+    """Run the app with a temp database and all webhooks pointed at the fake server.
+
+    ``server`` is 'sync' (gunicorn main:app, gthread workers) or 'async'
+    (uvicorn asgi:app); both get ``--workers`` processes.
+    """
+    port = free_port()
+    env = dict(
+        os.environ,
+        DATABASE_URL='sqlite:///' + os.path.join(workdir, 'visitors.db'),
+        NOTIFICATION_SERVICE=args.channel,
+        SECURITY_NOTIFICATION_SERVICE='app',
+        WECHAT_WEBHOOK=f'{webhook_url}/wechat',
+        DINGTALK_WEBHOOK=f'{webhook_url}/dingtalk',
+        HOST_NOTIFICATION_WEBHOOK=f'{webhook_url}/host',
+        SECURITY_WECHAT_WEBHOOK=f'{webhook_url}/security/wechat',
+        SECURITY_DINGTALK_WEBHOOK=f'{webhook_url}/security/dingtalk',
+        SECURITY_NOTIFICATION_WEBHOOK=f'{webhook_url}/security',
+        # Flask routes served through the async app's thread pool
+        ASGI_WSGI_THREADS=str(args.threads),
+    )
+    if server == 'async':
+        command = [
+            sys.executable, '-m', 'uvicorn', 'asgi:app',
+            '--host', '127.0.0.1', '--port', str(port),
+            '--workers', str(args.workers),
+            '--log-level', 'warning',
+        ]
+    else:
+        command = [
+            sys.executable, '-m', 'gunicorn', 'main:app',
+            '--bind', f'127.0.0.1:{port}',
+            '--workers', str(args.workers),
+            '--worker-class', 'gthread', '--threads', str(args.threads),
+            '--log-level', 'warning',
+        ]
+    log = open(os.path.join(workdir, f'{server}.log'), 'w')
+    process = subprocess.Popen(command, cwd=os.path.dirname(os.path.abspath(__file__)),
+                               env=env, stdout=log, stderr=subprocess.STDOUT)
+
+    base_url = f'http://127.0.0.1:{port}'
+    deadline = time.monotonic() + 30
+    while time.monotonic() < deadline:
+        if process.poll() is not None:
+            raise RuntimeError(f'{command[2]} exited early, see {log.name}')
+        try:
+            requests.get(f'{base_url}/api/notifications/stats', timeout=1)
+            return process, base_url
+        except requests.RequestException:
+            time.sleep(0.2)
+    process.terminate()
+    raise RuntimeError(f'{command[2]} did not start within 30s')
+
+
+class Recorder:
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.latencies = defaultdict(list)
+        self.errors = defaultdict(int)
+
+    def call(self, session, endpoint, method, url, **kwargs):
+        started = time.perf_counter()
+        try:
+            response = session.request(method, url, timeout=30, **kwargs)
+            ok = response.status_code < 400
+        except requests.RequestException:
+            response, ok = None, False
+        elapsed = time.perf_counter() - started
+        with self.lock:
+            self.latencies[endpoint].append(elapsed)
+            if not ok:
+                self.errors[endpoint] += 1
+        return response if ok else None
+
+
+def run_flow(recorder, base_url, index, scenario='flow'):
+    """One visitor: register, host approves, security feed is checked.
+
+    The 'register' scenario stops after the registration.
+    """
+    session = requests.Session()
+    visitor = {
+        'name': f'访客{index}',
+        'phone': f'138{index:08d}',
+        'company': '压测公司',
+        'host_name': '被拜访人',
+        'host_company': '接待单位',
+        'host_phone': f'139{index % 50:08d}',
+    }
+    response = recorder.call(session, 'POST /api/visitors', 'POST', f'{base_url}/api/visitors', json=visitor)
+    if response is None or scenario == 'register':
+        return
+    visitor_id = response.json()['id']
+    recorder.call(session, 'PUT /api/visitors/<id>/status', 'PUT',
+                  f'{base_url}/api/visitors/{visitor_id}/status', json={'status': 'approved'})
+    recorder.call(session, 'GET /api/security/notifications', 'GET',
+                  f'{base_url}/api/security/notifications', params={'limit': 50})
+    recorder.call(session, 'GET /api/visitors/<id>', 'GET', f'{base_url}/api/visitors/{visitor_id}')
+
+
+def percentile(sorted_values, fraction):
+    """Nearest-rank percentile of an already sorted list"""
+    index = max(0, math.ceil(fraction * len(sorted_values)) - 1)
+    return sorted_values[min(index, len(sorted_values) - 1)]
+
+
+def report(recorder, elapsed):
+    print(f"\n{'endpoint':<36}{'count':>7}{'errors':>8}{'req/s':>9}{'p50 ms':>9}{'p95 ms':>9}{'p99 ms':>9}")
+    worst_p95 = 0.0
+    for endpoint, values in recorder.latencies.items():
+        values = sorted(values)
+        p50, p95, p99 = (percentile(values, q) * 1000 for q in (0.50, 0.95, 0.99))
+        worst_p95 = max(worst_p95, p95)
+        print(f"{endpoint:<36}{len(values):>7}{recorder.errors[endpoint]:>8}{len(values) / elapsed:>9.1f}"
+              f"{p50:>9.1f}{p95:>9.1f}{p99:>9.1f}")
+    return worst_p95
+
+
+def wait_for_outbox(base_url, timeout=120):
+    """Seconds until no outbox row is pending, or None if it did not drain in time"""
+    started = time.perf_counter()
+    while time.perf_counter() - started < timeout:
+        outbox = requests.get(f'{base_url}/api/notifications/stats', timeout=10).json()['outbox']
+        if outbox['pending'] == 0:
+            return time.perf_counter() - started
+        time.sleep(0.2)
+    return None
+
+
+def run(args, server, webhook_url):
+    """Boot one server and drive ``--flows`` flows through it.
+
+    Returns (recorder, seconds for the flows, seconds until every
+    notification was delivered). Requests can return before their
+    notifications are sent, so the second figure shows the work left behind.
+    """
+    with tempfile.TemporaryDirectory() as workdir:
+        process, base_url = start_app(args, server, webhook_url, workdir)
+        app_name = 'uvicorn asgi:app' if server == 'async' else f'gunicorn main:app ({args.threads} threads)'
+        print(f"\n{app_name} on {base_url}, {args.workers} workers, fake webhook "
+              f"{args.webhook_latency * 1000:.0f} ms, {args.webhook_failure_rate:.0%} failures")
+        try:
+            recorder = Recorder()
+            started = time.perf_counter()
+            with ThreadPoolExecutor(max_workers=args.concurrency) as pool:
+                list(pool.map(lambda index: run_flow(recorder, base_url, index, args.scenario),
+                              range(args.flows)))
+            elapsed = time.perf_counter() - started
+            drained = wait_for_outbox(base_url)
+            delivered = None if drained is None else elapsed + drained
+        finally:
+            process.terminate()
+            process.wait(timeout=30)
+    return recorder, elapsed, delivered
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--flows', type=int, default=200, help='number of register/approve/feed flows')
+    parser.add_argument('--concurrency', type=int, default=20, help='concurrent client threads')
+    parser.add_argument('--server', default='sync', choices=['sync', 'async', 'compare'],
+                        help='gunicorn main:app, uvicorn asgi:app, or both one after the other')
+    parser.add_argument('--scenario', default='flow', choices=['flow', 'register'],
+                        help='full register/approve/feed flows, or registrations only')
+    parser.add_argument('--workers', type=int, default=2, help='worker processes (same for both servers)')
+    parser.add_argument('--threads', type=int, default=4,
+                        help='threads per gunicorn worker / Flask threads per uvicorn worker')
+    parser.add_argument('--channel', default='webhook', choices=['webhook', 'wechat', 'dingtalk'],
+                        help='NOTIFICATION_SERVICE for host notifications')
+    parser.add_argument('--webhook-latency', type=float, default=0.05, help='fake webhook delay in seconds')
+    parser.add_argument('--webhook-failure-rate', type=float, default=0.0, help='fraction of webhook calls answered 500')
+    parser.add_argument('--max-p95-ms', type=float, help='exit with status 1 if any endpoint p95 exceeds this')
+    args = parser.parse_args()
+
+    webhook = start_fake_webhook(args.webhook_latency, args.webhook_failure_rate)
+    webhook_url = f'http://127.0.0.1:{webhook.server_address[1]}'
+
+    servers = ['sync', 'async'] if args.server == 'compare' else [args.server]
+    worst_p95, throughput, delivery = 0.0, {}, {}
+    for server in servers:
+        recorder, elapsed, delivery[server] = run(args, server, webhook_url)
+        throughput[server] = args.flows / elapsed
+        print(f"\n{args.flows} flows in {elapsed:.2f}s ({throughput[server]:.1f} flows/s), "
+              + (f"all notifications delivered after {delivery[server]:.2f}s" if delivery[server] is not None
+                 else "notifications still pending after 120s"))
+        worst_p95 = max(worst_p95, report(recorder, elapsed))
+    print(f"\nfake webhook received: {dict(webhook.received)}, injected failures: {webhook.failed}")
+    webhook.shutdown()
+
+    if len(throughput) == 2:
+        print(f"\n{args.scenario} throughput at {args.workers} workers: sync {throughput['sync']:.1f}/s, "
+              f"async {throughput['async']:.1f}/s ({throughput['async'] / throughput['sync']:.2f}x)")
+        if None not in delivery.values():
+            print(f"notifications delivered after: sync {delivery['sync']:.2f}s, async {delivery['async']:.2f}s")
+
+    if args.max_p95_ms is not None and worst_p95 > args.max_p95_ms:
+        print(f"\n✗ p95 {worst_p95:.1f} ms exceeds --max-p95-ms {args.max_p95_ms}")
+        return 1
+    print("\n✓ Load test completed")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
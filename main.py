@@ -1,24 +1,118 @@
-from flask import Flask, request, jsonify
+from flask import Flask, Response, abort, g, has_app_context, request, jsonify, stream_with_context
 from flask_sqlalchemy import SQLAlchemy
-from datetime import datetime
+from flask_sqlalchemy.session import Session as FlaskSession
+from datetime import datetime, timedelta
+from sqlalchemy import delete, event, func, insert, inspect, select, text, tuple_, update
+from sqlalchemy.exc import DatabaseError, IntegrityError, OperationalError
+from sqlalchemy.schema import CreateIndex
 import qrcode
+import qrcode.image.svg
 import io
 import base64
-import requests
+import click
+import csv
+import functools
+import cProfile
+import gzip
+import hashlib
+import heapq
+import hmac
 import os
+import random
+import re
+import json
+import socket
+import threading
+import time
+from collections import namedtuple
+from functools import lru_cache
+from itertools import islice
+from urllib.parse import urlencode
+
+from cache import TTLCache
+from metrics import MetricsRegistry
+from notifications import (CallbackChannel, coalescer_from_env, dispatcher_from_env, registry_from_env,
+                           transport_from_env)
+
+try:
+    import brotli
+except ImportError:  # optional: pages are still served gzip-compressed
+    brotli = None
 
 # Create the main Flask application to handle all services
 app = Flask(__name__)
 
+def database_uri(url):
+    """SQLAlchemy URI for a DATABASE_URL (Heroku/Railway still hand out postgres://)"""
+    return url.replace('postgres://', 'postgresql://', 1) if url.startswith('postgres://') else url
+
+def engine_options_from_env(uri):
+    """Connection pool settings for server databases (SQLite keeps SQLAlchemy's defaults).
+
+    Every gunicorn worker has its own pool, so workers x (DB_POOL_SIZE +
+    DB_MAX_OVERFLOW) must stay below the server's connection limit.
+    """
+    if uri.startswith('sqlite'):
+        return {}
+    return {
+        'pool_size': int(os.getenv('DB_POOL_SIZE', 5)),
+        'max_overflow': int(os.getenv('DB_MAX_OVERFLOW', 10)),
+        'pool_timeout': float(os.getenv('DB_POOL_TIMEOUT', 30)),
+        'pool_recycle': int(os.getenv('DB_POOL_RECYCLE', 1800)),
+        'pool_pre_ping': os.getenv('DB_POOL_PRE_PING', '1').lower() in ('1', 'true', 'yes'),
+    }
+
 # Configure database - use PostgreSQL in production, SQLite in development
 DATABASE_URL = os.getenv('DATABASE_URL', 'sqlite:///visitors.db')
-app.config['SQLALCHEMY_DATABASE_URI'] = DATABASE_URL.replace('postgres://', 'postgresql://') if DATABASE_URL.startswith('postgres://') else DATABASE_URL
+app.config['SQLALCHEMY_DATABASE_URI'] = database_uri(DATABASE_URL)
+app.config['SQLALCHEMY_ENGINE_OPTIONS'] = engine_options_from_env(app.config['SQLALCHEMY_DATABASE_URI'])
 app.config['SQLALCHEMY_TRACK_MODIFICATIONS'] = False
 
-db = SQLAlchemy(app)
+# Optional read replica for read-only routes (see read_replica below)
+DATABASE_REPLICA_URL = os.getenv('DATABASE_REPLICA_URL')
+if DATABASE_REPLICA_URL:
+    replica_uri = database_uri(DATABASE_REPLICA_URL)
+    app.config['SQLALCHEMY_BINDS'] = {'replica': dict(engine_options_from_env(replica_uri), url=replica_uri)}
+
+class RoutingSession(FlaskSession):
+    """Session that reads from the replica while the current request is marked for it.
+
+    Flushes always go to the primary.
+    """
+
+    def get_bind(self, mapper=None, clause=None, bind=None, **kwargs):
+        if bind is None and not self._flushing and has_app_context() and g.get('use_replica'):
+            return db.engines['replica']
+        return super().get_bind(mapper=mapper, clause=clause, bind=bind, **kwargs)
+
+db = SQLAlchemy(app, session_options={'class_': RoutingSession})
+
+# SQLite settings for several gunicorn workers sharing one database file:
+# WAL lets readers carry on while one worker writes, and busy_timeout makes a
+# writer wait for the lock instead of failing with "database is locked".
+# Applied to every new connection; busy_timeout goes first so that switching
+# the journal mode also waits for the lock.
+SQLITE_PRAGMAS = {
+    'busy_timeout': int(os.getenv('SQLITE_BUSY_TIMEOUT', 30000)),
+    'journal_mode': os.getenv('SQLITE_JOURNAL_MODE', 'WAL'),
+    'synchronous': os.getenv('SQLITE_SYNCHRONOUS', 'NORMAL'),
+    'cache_size': int(os.getenv('SQLITE_CACHE_SIZE', -16000)),
+    'temp_store': 'MEMORY',
+}
+
+def _set_sqlite_pragmas(dbapi_connection, connection_record):
+    cursor = dbapi_connection.cursor()
+    for name, value in SQLITE_PRAGMAS.items():
+        cursor.execute(f'PRAGMA {name}={value}')
+    cursor.close()
+
+with app.app_context():
+    if db.engine.dialect.name == 'sqlite':
+        event.listen(db.engine, 'connect', _set_sqlite_pragmas)
 
 # Database Models
-class Visitor(db.Model):
+class VisitorColumns:
+    """Columns shared by the hot ``visitor`` table and ``visitor_archive``"""
     id = db.Column(db.Integer, primary_key=True)
     name = db.Column(db.String(100), nullable=False)
     phone = db.Column(db.String(20), nullable=False)
@@ -42,12 +136,855 @@ class Visitor(db.Model):
             'status': self.status
         }
 
-# Create tables
+class Visitor(VisitorColumns, db.Model):
+    # Indexes for the hot queries: newest-first listing, status filter, per-host
+    # history and the per-host pending queue (host page).
+    # Existing databases get them via `flask --app main create-indexes`.
+    __table_args__ = (
+        db.Index('ix_visitor_visit_time_id', 'visit_time', 'id'),
+        db.Index('ix_visitor_status_visit_time', 'status', 'visit_time'),
+        db.Index('ix_visitor_host_phone_visit_time', 'host_phone', 'visit_time'),
+        db.Index('ix_visitor_host_phone_status_visit_time', 'host_phone', 'status', 'visit_time'),
+    )
+
+class VisitorArchive(VisitorColumns, db.Model):
+    """Visitors older than the retention period, moved out by `archive-visitors`.
+
+    Rows keep their original ids; listings and exports read both tables.
+    """
+    __tablename__ = 'visitor_archive'
+    __table_args__ = (
+        db.Index('ix_visitor_archive_visit_time_id', 'visit_time', 'id'),
+        db.Index('ix_visitor_archive_status_visit_time', 'status', 'visit_time'),
+        db.Index('ix_visitor_archive_host_phone_visit_time', 'host_phone', 'visit_time'),
+    )
+
+class SecurityNotification(db.Model):
+    """Security feed entry shared by all workers; the id is the SSE event id.
+
+    ``payload`` is the pre-encoded JSON object without its event_id, which is
+    spliced in when the feed is read.
+    """
+    __tablename__ = 'security_feed'
+    id = db.Column(db.Integer, primary_key=True)
+    timestamp = db.Column(db.String(32), nullable=False, index=True)
+    payload = db.Column(db.Text, nullable=False)
+
+class NotificationOutbox(db.Model):
+    """Notifications written in the same transaction as the visitor change.
+
+    One row per channel; the outbox relay delivers them and retries failures.
+    """
+    __tablename__ = 'notification_outbox'
+    id = db.Column(db.Integer, primary_key=True)
+    audience = db.Column(db.String(20), nullable=False)  # host, security
+    channel = db.Column(db.String(20), nullable=False)
+    message = db.Column(db.Text, nullable=False)
+    payload = db.Column(db.Text, nullable=False)
+    status = db.Column(db.String(10), nullable=False, default='pending')  # pending, sending, sent, failed, merged
+    attempts = db.Column(db.Integer, nullable=False, default=0)
+    next_attempt_at = db.Column(db.DateTime, nullable=False, default=datetime.utcnow)
+    last_error = db.Column(db.Text)
+    created_at = db.Column(db.DateTime, nullable=False, default=datetime.utcnow)
+    sent_at = db.Column(db.DateTime)
+
+    __table_args__ = (
+        db.Index('ix_notification_outbox_status_next_attempt_at', 'status', 'next_attempt_at'),
+    )
+
+class JobLease(db.Model):
+    """Named lease so that a periodic job runs in only one worker at a time"""
+    __tablename__ = 'job_lease'
+    name = db.Column(db.String(50), primary_key=True)
+    holder = db.Column(db.String(100))
+    expires_at = db.Column(db.DateTime, nullable=False, default=datetime.utcnow)
+
+def acquire_lease(name, holder, seconds):
+    """Take or renew the ``name`` lease for ``seconds``; False while another holder has it"""
+    if db.session.get(JobLease, name) is None:
+        try:
+            db.session.add(JobLease(name=name, expires_at=datetime.utcnow()))
+            db.session.commit()
+        except IntegrityError:
+            # Another worker created it first
+            db.session.rollback()
+    now = datetime.utcnow()
+    taken = db.session.execute(
+        update(JobLease)
+        .where(JobLease.name == name, (JobLease.expires_at <= now) | (JobLease.holder == holder))
+        .values(holder=holder, expires_at=now + timedelta(seconds=seconds))
+    ).rowcount
+    db.session.commit()
+    return bool(taken)
+
+class DataVersion(db.Model):
+    """Counter bumped in every transaction that changes a dataset, used for ETags"""
+    __tablename__ = 'data_version'
+    name = db.Column(db.String(50), primary_key=True)
+    version = db.Column(db.Integer, nullable=False, default=0)
+
+def data_version(name='visitors'):
+    """Current value of a data-version counter (a single primary-key read)"""
+    return db.session.execute(select(DataVersion.version).where(DataVersion.name == name)).scalar() or 0
+
+def data_version_bump(name='visitors'):
+    """UPDATE statement that increments a data-version counter"""
+    return update(DataVersion).where(DataVersion.name == name).values(version=DataVersion.version + 1)
+
+def bump_data_version(name='visitors'):
+    """Increment a data-version counter; the row stays locked until the commit.
+
+    Visitor writes call it last before their commit to keep that lock short;
+    the security feed calls it first to serialise appends.
+    """
+    db.session.execute(data_version_bump(name))
+
+# Create tables. Workers starting together on a fresh database race to create
+# them; the loser of a race sees "already exists" and simply checks again.
 with app.app_context():
-    db.create_all()
+    for attempt in range(5):
+        try:
+            # Primary only; a read replica gets its schema through replication
+            db.create_all(bind_key=None)
+            break
+        except DatabaseError:
+            if attempt == 4:
+                raise
+            time.sleep(0.2)
+    # Seed the counters; another worker may be doing the same
+    for name in ('visitors', 'security_feed'):
+        if db.session.get(DataVersion, name) is None:
+            try:
+                db.session.add(DataVersion(name=name, version=0))
+                db.session.commit()
+            except IntegrityError:
+                db.session.rollback()
+
+def migrate_legacy_security_feed():
+    """Move the old ``security_notification`` overflow table into ``security_feed`` and drop it.
+
+    Runs once, in whichever worker takes the lease; copying and dropping
+    happen in one transaction. Old entries keep their order but get new
+    event ids after any already in the feed (appends wait for the lock on the
+    feed counter meanwhile, see ``SecurityFeed.append``).
+    """
+    if not inspect(db.engine).has_table('security_notification'):
+        return 0
+    if not acquire_lease('migrate-security-feed', f'{socket.gethostname()}:{os.getpid()}', 300):
+        return 0
+    try:
+        rows = db.session.execute(text(
+            'SELECT timestamp, payload FROM security_notification ORDER BY event_id, id')).all()
+        bump_data_version('security_feed')
+        entries = []
+        for timestamp, payload in rows:
+            data = json.loads(payload)
+            data.pop('event_id', None)
+            entries.append(SecurityNotification(timestamp=timestamp, payload=json.dumps(data, ensure_ascii=False)))
+        db.session.add_all(entries)
+        db.session.execute(text('DROP TABLE security_notification'))
+        db.session.commit()
+    except DatabaseError:
+        # Already migrated and dropped by another worker
+        db.session.rollback()
+        return 0
+    print(f"Moved {len(entries)} security notifications from security_notification into security_feed")
+    return len(entries)
+
+with app.app_context():
+    migrate_legacy_security_feed()
+
+# Metrics for /metrics (Prometheus text format). Each gunicorn worker keeps its
+# own values; visitor_worker_info tells which worker answered a scrape.
+metrics = MetricsRegistry()
+request_latency = metrics.histogram('http_request_duration_seconds', 'Request latency by route',
+                                    ['method', 'route', 'status'])
+db_query_latency = metrics.histogram('db_query_duration_seconds', 'Database statement execution time')
+notification_latency = metrics.histogram('notification_send_duration_seconds', 'Notification send latency',
+                                         ['audience', 'channel', 'outcome'])
+metrics.gauge('visitor_worker_info', 'Identity of the worker process serving this scrape',
+              lambda: {(socket.gethostname(), os.getpid()): 1}, ['hostname', 'pid'])
+
+def _before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    conn.info.setdefault('query_started', []).append(time.perf_counter())
+
+def _after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    db_query_latency.observe(time.perf_counter() - conn.info['query_started'].pop())
+
+with app.app_context():
+    for engine in db.engines.values():
+        event.listen(engine, 'before_cursor_execute', _before_cursor_execute)
+        event.listen(engine, 'after_cursor_execute', _after_cursor_execute)
+
+class ReplicaRouter:
+    """Tracks whether the read replica is usable.
+
+    After a connection error the replica is skipped for ``retry_interval``
+    seconds and reads go to the primary meanwhile.
+    """
+
+    def __init__(self, enabled, retry_interval=30.0):
+        self.enabled = enabled
+        self.retry_interval = retry_interval
+        self._down_until = 0.0
+        self._lock = threading.Lock()
+        self._count = {'replica': 0, 'primary': 0, 'fallbacks': 0}
+
+    def available(self):
+        return self.enabled and time.monotonic() >= self._down_until
+
+    def record(self, target):
+        with self._lock:
+            self._count[target] += 1
+
+    def mark_down(self, error):
+        print(f"Read replica unavailable, using the primary for {self.retry_interval:.0f}s: {str(error)}")
+        with self._lock:
+            self._down_until = time.monotonic() + self.retry_interval
+            self._count['fallbacks'] += 1
+
+    def stats(self):
+        with self._lock:
+            return dict(self._count, enabled=self.enabled, available=self.available())
+
+replica_router = ReplicaRouter(bool(DATABASE_REPLICA_URL), float(os.getenv('DATABASE_REPLICA_RETRY_INTERVAL', 30)))
+
+def replica_stream(body):
+    """A streamed response body that marks the replica down if reading it fails"""
+    try:
+        yield from body
+    except OperationalError as e:
+        replica_router.mark_down(e)
+        raise
+
+def read_replica(view):
+    """Serve a read-only view from the replica, falling back to the primary.
+
+    Reads may lag the primary by the replication delay. A connection error
+    raised by the view is retried once on the primary. A streamed body only
+    queries once it is being sent, so the replica is checked with a cheap
+    query before returning it; an error later in the stream cannot be retried
+    any more, but marks the replica down for the requests after it.
+    """
+    @functools.wraps(view)
+    def wrapper(*args, **kwargs):
+        if not replica_router.available():
+            replica_router.record('primary')
+            return view(*args, **kwargs)
+        g.use_replica = True
+        response = None
+        try:
+            response = view(*args, **kwargs)
+            if isinstance(response, Response) and response.is_streamed:
+                db.session.execute(text('SELECT 1'))
+                response.response = replica_stream(response.response)
+            replica_router.record('replica')
+            return response
+        except OperationalError as e:
+            if isinstance(response, Response):
+                # Ends the unsent stream (and the request context it holds)
+                response.close()
+            replica_router.mark_down(e)
+            db.session.rollback()
+            g.use_replica = False
+            replica_router.record('primary')
+            return view(*args, **kwargs)
+    return wrapper
+
+def pool_usage():
+    """Connections per engine and state, for the pool gauges"""
+    usage = {}
+    with app.app_context():
+        for name, engine in db.engines.items():
+            pool = engine.pool
+            if not hasattr(pool, 'checkedout'):
+                continue
+            name = name or 'primary'
+            usage[(name, 'checked_out')] = pool.checkedout()
+            usage[(name, 'idle')] = pool.checkedin()
+            usage[(name, 'overflow')] = max(pool.overflow(), 0)
+            usage[(name, 'size')] = pool.size()
+    return usage
+
+metrics.gauge('db_pool_connections', 'Connection pool usage per database and state',
+              pool_usage, ['database', 'state'])
+metrics.gauge('db_read_routing', 'Read-only requests by database served since worker start',
+              lambda: {(name,): replica_router.stats()[name] for name in ('replica', 'primary', 'fallbacks')},
+              ['target'])
+
+@app.before_request
+def start_request_timer():
+    g.request_started = time.perf_counter()
+
+@app.after_request
+def record_request_latency(response):
+    started = g.pop('request_started', None)
+    if started is not None:
+        route = request.url_rule.rule if request.url_rule else 'unmatched'
+        request_latency.observe(time.perf_counter() - started,
+                                method=request.method, route=route, status=response.status_code)
+    return response
+
+# Opt-in request profiling. PROFILE_SAMPLE_RATE profiles that fraction of all
+# requests; with PROFILE_SECRET set, a request carrying X-Profile-Expires: <unix
+# time> and X-Profile-Signature: hex(HMAC-SHA256(secret, "<METHOD> <path>
+# <expires>")) is always profiled until it expires. Profiles are written to
+# PROFILE_DIR in cProfile/pstats format, at most PROFILE_MAX_FILES of them.
+PROFILE_SAMPLE_RATE = float(os.getenv('PROFILE_SAMPLE_RATE', 0))
+PROFILE_SECRET = os.getenv('PROFILE_SECRET', '')
+PROFILE_DIR = os.getenv('PROFILE_DIR', 'profiles')
+PROFILE_MAX_FILES = int(os.getenv('PROFILE_MAX_FILES', 100))
+# Signatures valid for longer than this are refused, so a leaked one is only replayable briefly
+PROFILE_SIGNATURE_MAX_AGE = int(os.getenv('PROFILE_SIGNATURE_MAX_AGE', 300))
+PROFILING_ENABLED = PROFILE_SAMPLE_RATE > 0 or bool(PROFILE_SECRET)
+
+def valid_profile_signature(method, path, expires, signature, now=None):
+    """True for a signature of "<method> <path> <expires>" that has not expired yet"""
+    try:
+        expires_at = int(expires)
+    except (TypeError, ValueError):
+        return False
+    now = time.time() if now is None else now
+    if not now <= expires_at <= now + PROFILE_SIGNATURE_MAX_AGE:
+        return False
+    expected = hmac.new(PROFILE_SECRET.encode(), f'{method} {path} {expires_at}'.encode(),
+                        hashlib.sha256).hexdigest()
+    # Compared as bytes: header values may hold any latin-1 character, which compare_digest refuses in str
+    return hmac.compare_digest(signature.encode(), expected.encode())
+
+def should_profile():
+    signature = request.headers.get('X-Profile-Signature')
+    if PROFILE_SECRET and signature:
+        return valid_profile_signature(request.method, request.path,
+                                       request.headers.get('X-Profile-Expires'), signature)
+    return random.random() < PROFILE_SAMPLE_RATE
+
+def profile_dir_full():
+    try:
+        count = sum(1 for name in os.listdir(PROFILE_DIR) if name.endswith('.prof'))
+    except FileNotFoundError:
+        return False
+    return count >= PROFILE_MAX_FILES
+
+if PROFILING_ENABLED:
+    @app.before_request
+    def start_profiler():
+        if not should_profile():
+            return
+        if profile_dir_full():
+            print(f"Not profiling {request.method} {request.path}: {PROFILE_DIR} already holds "
+                  f"{PROFILE_MAX_FILES} profiles")
+            return
+        profiler = cProfile.Profile()
+        try:
+            profiler.enable()
+        except ValueError:
+            # Another request on this worker is already being profiled
+            return
+        g.profiler = profiler
+
+    @app.after_request
+    def save_profile(response):
+        profiler = g.pop('profiler', None)
+        if profiler is None:
+            return response
+        profiler.disable()
+        os.makedirs(PROFILE_DIR, exist_ok=True)
+        slug = re.sub(r'[^A-Za-z0-9]+', '_', request.path).strip('_') or 'root'
+        filename = f"{datetime.now().strftime('%Y%m%dT%H%M%S%f')}-{request.method}-{slug}-{os.getpid()}.prof"
+        profiler.dump_stats(os.path.join(PROFILE_DIR, filename))
+        response.headers['X-Profile-File'] = filename
+        return response
+
+    @app.teardown_request
+    def stop_profiler(exc):
+        # after_request is skipped when a view raises; never leave a profiler running
+        profiler = g.pop('profiler', None)
+        if profiler is not None:
+            profiler.disable()
+
+def create_missing_indexes(engine):
+    """Add any declared Visitor indexes missing from an existing database.
+
+    On PostgreSQL the indexes are built with CREATE INDEX CONCURRENTLY so
+    registrations keep writing while they build; if a concurrent build fails
+    it leaves an INVALID index that must be dropped before re-running.
+    SQLite has no concurrent build, but the index is built in a single short
+    write transaction. Returns the names of the indexes created.
+    """
+    table = Visitor.__table__
+    existing = {index['name'] for index in inspect(engine).get_indexes(table.name)}
+    created = []
+    for index in sorted(table.indexes, key=lambda index: index.name):
+        if index.name in existing:
+            continue
+        ddl = str(CreateIndex(index, if_not_exists=True).compile(dialect=engine.dialect))
+        if engine.dialect.name == 'postgresql':
+            ddl = ddl.replace('CREATE INDEX', 'CREATE INDEX CONCURRENTLY', 1)
+        # CONCURRENTLY cannot run inside a transaction block
+        with engine.connect().execution_options(isolation_level='AUTOCOMMIT') as conn:
+            conn.execute(text(ddl))
+        created.append(index.name)
+    return created
+
+@app.cli.command('create-indexes')
+def create_indexes_command():
+    """Create missing Visitor indexes on an existing database."""
+    created = create_missing_indexes(db.engine)
+    print(f"Created indexes: {', '.join(created)}" if created else "All indexes already exist")
+
+class VisitorArchiver:
+    """Moves visitors older than ``retention_days`` into ``visitor_archive``.
+
+    Rows move oldest first in batches of ``batch_size``; each batch is copied
+    and deleted in one transaction, so an interrupted run leaves nothing half
+    moved and the next run carries on from there. The newest visitor always
+    stays, so SQLite never hands an archived id out again. With ``interval``
+    set, it also runs in the background every ``interval`` seconds, in
+    whichever worker holds the 'archive-visitors' lease; another worker takes
+    over once a holder stops renewing it.
+    """
+
+    def __init__(self, retention_days=365, batch_size=1000, interval=0):
+        self.retention_days = retention_days
+        self.batch_size = batch_size
+        self.interval = interval
+        self._pid = None
+        self._lock = threading.Lock()
+        self.holder = None
+
+    def run_once(self, max_batches=None):
+        """Archive everything past the retention period; returns the number of rows moved"""
+        cutoff = datetime.utcnow() - timedelta(days=self.retention_days)
+        columns = [column.name for column in Visitor.__table__.columns]
+        newest_id = db.session.query(func.max(Visitor.id)).scalar()
+        moved = batches = 0
+        while max_batches is None or batches < max_batches:
+            ids = [visitor_id for (visitor_id,) in (db.session.query(Visitor.id)
+                                                    .filter(Visitor.visit_time < cutoff, Visitor.id != newest_id)
+                                                    .order_by(Visitor.visit_time, Visitor.id)
+                                                    .limit(self.batch_size))]
+            if not ids:
+                break
+            db.session.execute(insert(VisitorArchive).from_select(
+                columns, select(*(Visitor.__table__.c[name] for name in columns)).where(Visitor.id.in_(ids))))
+            db.session.execute(delete(Visitor).where(Visitor.id.in_(ids)))
+            db.session.commit()
+            moved += len(ids)
+            batches += 1
+        return moved
 
-# In-memory storage for security notifications (in production, use a database)
-security_notifications = []
+    def ensure_started(self):
+        if self.interval <= 0 or self._pid == os.getpid():
+            return
+        with self._lock:
+            if self._pid == os.getpid():
+                return
+            self._pid = os.getpid()
+            self.holder = f'{socket.gethostname()}:{os.getpid()}'
+            threading.Thread(target=self._run, name='visitor-archiver', daemon=True).start()
+
+    def run_if_leased(self):
+        """One background run, if this worker holds the lease; returns rows moved or None"""
+        with app.app_context():
+            # Renewed every run; lapses two intervals after the holder stops
+            if not acquire_lease('archive-visitors', self.holder, 2 * self.interval):
+                return None
+            return self.run_once()
+
+    def _run(self):
+        while True:
+            time.sleep(self.interval)
+            try:
+                moved = self.run_if_leased()
+                if moved:
+                    print(f"Archived {moved} visitors")
+            except Exception as e:
+                print(f"Visitor archival failed: {str(e)}")
+
+visitor_archiver = VisitorArchiver(
+    retention_days=int(os.getenv('ARCHIVE_AFTER_DAYS', 365)),
+    batch_size=int(os.getenv('ARCHIVE_BATCH_SIZE', 1000)),
+    interval=float(os.getenv('ARCHIVE_INTERVAL', 0)),
+)
+
+@app.before_request
+def start_visitor_archiver():
+    visitor_archiver.ensure_started()
+
+@app.cli.command('archive-visitors')
+@click.option('--days', type=int, help='Archive visitors older than this (default ARCHIVE_AFTER_DAYS)')
+@click.option('--max-batches', type=int, help='Stop after this many batches (resume later)')
+def archive_visitors_command(days, max_batches):
+    """Move old visitors from the visitor table into visitor_archive."""
+    if days is not None:
+        visitor_archiver.retention_days = days
+    moved = visitor_archiver.run_once(max_batches=max_batches)
+    print(f"Archived {moved} visitors")
+
+# Security feed entry: its event id, timestamp and the JSON payload (with the
+# event id already in it), so serving the feed never re-serialises entries
+SecurityRecord = namedtuple('SecurityRecord', ['event_id', 'timestamp', 'payload'])
+
+def with_event_id(event_id, payload):
+    """Splice the event id into a stored payload (a non-empty JSON object)"""
+    return f'{{"event_id": {event_id}, {payload[1:]}'
+
+class SecurityFeed:
+    """Security feed shared by all workers through the ``security_feed`` table.
+
+    An append is one single-row insert, and newest-first reads walk the
+    primary key backwards, so every worker serves the same feed equally fast.
+    Appends are serialised on the 'security_feed' data-version row, so ids
+    commit in order and a stream that has read id N never misses a smaller
+    one committed later; the counter also versions the feed's ETag.
+    Streaming subscribers wait on ``changed``. Appends in this worker notify
+    it straight away. A watcher thread polls the newest id every
+    ``poll_interval`` seconds, while someone is waiting, to pick up appends
+    from other workers.
+    """
+
+    def __init__(self, page_size=1000, poll_interval=1.0):
+        self.page_size = page_size
+        self.poll_interval = poll_interval
+        self.changed = threading.Condition()
+        self._known_id = 0
+        self._waiting = 0
+        self._pid = None
+
+    @property
+    def last_event_id(self):
+        return db.session.query(func.max(SecurityNotification.id)).scalar() or 0
+
+    def append(self, data):
+        """Store a notification (committed at once) and wake streaming dashboards"""
+        data = dict(data)
+        data.pop('event_id', None)
+        payload = json.dumps(data, ensure_ascii=False)
+        with app.app_context():
+            # Bump first: the row lock is held until the commit, so the next
+            # append only gets its id once this one is visible
+            bump_data_version('security_feed')
+            row = SecurityNotification(timestamp=data.get('timestamp', ''), payload=payload)
+            db.session.add(row)
+            db.session.flush()
+            event_id = row.id
+            db.session.commit()
+        self._seen(event_id)
+        data['event_id'] = event_id
+        return data
+
+    def _seen(self, event_id):
+        with self.changed:
+            if event_id > self._known_id:
+                self._known_id = event_id
+                self.changed.notify_all()
+
+    def newest(self, limit=None, since=0):
+        """Payloads newest-first, at most ``limit``, with event_id > ``since``"""
+        rows = (db.session.query(SecurityNotification.id, SecurityNotification.payload)
+                .filter(SecurityNotification.id > since)
+                .order_by(SecurityNotification.id.desc())
+                .limit(limit or self.page_size))
+        return [with_event_id(event_id, payload) for event_id, payload in rows]
+
+    def after(self, event_id, timeout=None):
+        """Records oldest-first with event_id > ``event_id``, waiting up to ``timeout`` for one"""
+        self._ensure_watching()
+        records = self._read_after(event_id)
+        if records or not timeout:
+            return records
+        with self.changed:
+            if self._known_id <= event_id:
+                self._waiting += 1
+                try:
+                    self.changed.wait(timeout)
+                finally:
+                    self._waiting -= 1
+        return self._read_after(event_id)
+
+    def _read_after(self, event_id):
+        # Own context: the stream generator holds no database session between reads
+        with app.app_context():
+            rows = (SecurityNotification.query
+                    .filter(SecurityNotification.id > event_id)
+                    .order_by(SecurityNotification.id)
+                    .limit(self.page_size)
+                    .all())
+            records = [SecurityRecord(row.id, row.timestamp, with_event_id(row.id, row.payload)) for row in rows]
+        if records:
+            self._seen(records[-1].event_id)
+        return records
+
+    def _ensure_watching(self):
+        if self._pid == os.getpid():
+            return
+        with self.changed:
+            if self._pid == os.getpid():
+                return
+            self._pid = os.getpid()
+            threading.Thread(target=self._watch, name='security-feed-watcher', daemon=True).start()
+
+    def _watch(self):
+        while True:
+            time.sleep(self.poll_interval)
+            if not self._waiting:
+                continue
+            try:
+                with app.app_context():
+                    self._seen(self.last_event_id)
+            except Exception as e:
+                print(f"Security feed watcher failed: {str(e)}")
+
+# Security notifications, shared by all workers through the database
+security_notifications = SecurityFeed(page_size=int(os.getenv('SECURITY_FEED_PAGE_SIZE', 1000)),
+                                      poll_interval=float(os.getenv('SECURITY_FEED_POLL_INTERVAL', 1)))
+
+# How long a stream waits for new notifications before sending a keep-alive
+SECURITY_STREAM_KEEPALIVE = 15
+# Streams end after this many seconds and EventSource reconnects (resuming from
+# Last-Event-ID), so a stream never pins a request thread indefinitely
+SECURITY_STREAM_MAX_AGE = float(os.getenv('SECURITY_STREAM_MAX_AGE', 300))
+
+# Pooled keep-alive sessions (one per webhook host) with connect/read timeouts
+notification_transport = transport_from_env()
+
+# Background queue for host/security notifications, drained on worker exit
+# (created after the transport so it drains before the sessions are closed)
+notification_dispatcher = dispatcher_from_env()
+
+def add_to_security_feed(message, payload):
+    """The security 'app' channel: append to the shared security feed"""
+    security_notifications.append(dict(payload, timestamp=datetime.now().isoformat()))
+    print(f"Notification added to security app: visitor {payload['visitor_id']}, status: {payload['status']}")
+
+# Notification channels per audience, built once from NOTIFICATION_SERVICE and
+# SECURITY_NOTIFICATION_SERVICE (comma-separated lists send on every channel at once)
+notifiers = registry_from_env(
+    notification_transport,
+    observe=lambda audience, channel, outcome, seconds: notification_latency.observe(
+        seconds, audience=audience, channel=channel, outcome=outcome),
+    security_app=CallbackChannel('app', add_to_security_feed),
+)
+
+class OutboxRelay:
+    """Delivers NotificationOutbox rows with retries.
+
+    Rows are handed to the dispatcher right after the commit that created
+    them, and a poller thread in each worker picks up anything due for a
+    retry (or left in 'sending' by a worker that died mid-send). A row is
+    claimed with a conditional UPDATE, so only one worker sends it. Failed
+    sends are retried with exponential backoff and jitter until
+    ``max_attempts``, after which the row is marked 'failed'.
+    """
+
+    def __init__(self, max_attempts=8, base_delay=2.0, max_delay=600.0, poll_interval=5.0,
+                 lease=60.0, batch_size=50, retention_days=7):
+        self.max_attempts = max_attempts
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+        self.poll_interval = poll_interval
+        self.lease = lease
+        self.batch_size = batch_size
+        self.retention_days = retention_days
+        self._pid = None
+        self._lock = threading.Lock()
+        # Set by the ASGI app: rows are then sent from its event loop, and the
+        # thread-based poller and dispatcher deliveries stay off
+        self.handoff = None
+
+    def enqueue(self, audience, message, payload, hold=0.0):
+        """Add one outbox row per configured channel to the current session.
+
+        Call before the commit that saves the visitor change; returns the row
+        ids to pass to ``kick`` once that commit succeeds. Rows with a
+        ``hold`` (seconds) are not due until then, see ``send_host_digest``.
+        """
+        rows = self.rows(audience, message, payload, hold)
+        db.session.add_all(rows)
+        db.session.flush()
+        return [row.id for row in rows]
+
+    def rows(self, audience, message, payload, hold=0.0):
+        """Unsaved outbox rows for ``audience``, one per configured channel"""
+        channels = notifiers.channels(audience)
+        if not channels:
+            print(f"No {audience} notification channel configured")
+        next_attempt_at = datetime.utcnow() + timedelta(seconds=hold)
+        return [NotificationOutbox(audience=audience, channel=channel.name, message=message,
+                                   payload=json.dumps(payload, ensure_ascii=False),
+                                   next_attempt_at=next_attempt_at)
+                for channel in channels]
+
+    def release(self, outbox_ids):
+        """UPDATE making held rows due now"""
+        return (update(NotificationOutbox)
+                .where(NotificationOutbox.id.in_(outbox_ids), NotificationOutbox.status == 'pending')
+                .values(next_attempt_at=datetime.utcnow()))
+
+    def merge(self, outbox_ids):
+        """UPDATE retiring held rows whose content went out in a digest instead"""
+        return (update(NotificationOutbox)
+                .where(NotificationOutbox.id.in_(outbox_ids), NotificationOutbox.status == 'pending')
+                .values(status='merged', sent_at=datetime.utcnow()))
+
+    def kick(self, outbox_ids):
+        """Try the given rows right away on the background dispatcher"""
+        if self.handoff is not None:
+            return self.handoff(outbox_ids)
+        self.ensure_started()
+        for outbox_id in outbox_ids:
+            notification_dispatcher.submit(self.deliver, outbox_id)
+
+    def retry_delay(self, attempts):
+        """Exponential backoff with jitter: half fixed, half random"""
+        delay = min(self.max_delay, self.base_delay * 2 ** (attempts - 1))
+        return delay / 2 + random.uniform(0, delay / 2)
+
+    def claim(self, outbox_id):
+        """UPDATE that takes a due row for this worker; it was claimed if one row matched"""
+        now = datetime.utcnow()
+        return (update(NotificationOutbox)
+                .where(NotificationOutbox.id == outbox_id,
+                       NotificationOutbox.status.in_(('pending', 'sending')),
+                       NotificationOutbox.next_attempt_at <= now)
+                .values(status='sending', attempts=NotificationOutbox.attempts + 1,
+                        next_attempt_at=now + timedelta(seconds=self.lease)))
+
+    def due(self):
+        """SELECT of the ids due for (re)delivery, oldest first"""
+        return (select(NotificationOutbox.id)
+                .where(NotificationOutbox.status.in_(('pending', 'sending')),
+                       NotificationOutbox.next_attempt_at <= datetime.utcnow())
+                .order_by(NotificationOutbox.next_attempt_at)
+                .limit(self.batch_size))
+
+    def purge(self):
+        """DELETE of sent (or merged) rows older than ``retention_days``"""
+        return (delete(NotificationOutbox)
+                .where(NotificationOutbox.status.in_(('sent', 'merged')),
+                       NotificationOutbox.sent_at < datetime.utcnow() - timedelta(days=self.retention_days)))
+
+    def record(self, row, outcome, error):
+        """Mark a claimed row sent, failed, or pending again with a backoff"""
+        if outcome == 'success':
+            row.status = 'sent'
+            row.sent_at = datetime.utcnow()
+            row.last_error = None
+        elif row.attempts >= self.max_attempts:
+            row.status = 'failed'
+            row.last_error = error
+            print(f"Giving up on {row.audience} notification {row.id} via {row.channel} after {row.attempts} attempts")
+        else:
+            row.status = 'pending'
+            row.next_attempt_at = datetime.utcnow() + timedelta(seconds=self.retry_delay(row.attempts))
+            row.last_error = error
+
+    def deliver(self, outbox_id):
+        with app.app_context():
+            claimed = db.session.execute(self.claim(outbox_id)).rowcount
+            db.session.commit()
+            if not claimed:
+                return
+
+            row = db.session.get(NotificationOutbox, outbox_id)
+            # End the transaction before sending, so this thread does not hold
+            # a pooled connection idle in a transaction while the webhook answers
+            db.session.expunge(row)
+            db.session.commit()
+
+            outcome, error = notifiers.send_to(row.audience, row.channel, row.message, json.loads(row.payload))
+            db.session.add(row)
+            self.record(row, outcome, error)
+            db.session.commit()
+
+    def poll_once(self):
+        """Hand every row due for (re)delivery to the dispatcher and purge old sent rows"""
+        with app.app_context():
+            due = db.session.execute(self.due()).all()
+            db.session.execute(self.purge(), execution_options={'synchronize_session': False})
+            db.session.commit()
+        for (outbox_id,) in due:
+            notification_dispatcher.submit(self.deliver, outbox_id)
+
+    def ensure_started(self):
+        if self.handoff is not None:
+            return
+        if self._pid == os.getpid():
+            return
+        with self._lock:
+            if self._pid == os.getpid():
+                return
+            self._pid = os.getpid()
+            threading.Thread(target=self._run, name='outbox-relay', daemon=True).start()
+
+    def _run(self):
+        while True:
+            time.sleep(self.poll_interval)
+            try:
+                self.poll_once()
+            except Exception as e:
+                print(f"Outbox relay poll failed: {str(e)}")
+
+    def stats(self):
+        counts = dict(db.session.query(NotificationOutbox.status, func.count())
+                      .group_by(NotificationOutbox.status).all())
+        oldest_pending = (db.session.query(func.min(NotificationOutbox.created_at))
+                          .filter(NotificationOutbox.status.in_(('pending', 'sending'))).scalar())
+        return {
+            'pending': counts.get('pending', 0) + counts.get('sending', 0),
+            'failed': counts.get('failed', 0),
+            'sent': counts.get('sent', 0),
+            'merged': counts.get('merged', 0),
+            'oldest_pending_seconds': (datetime.utcnow() - oldest_pending).total_seconds() if oldest_pending else None,
+        }
+
+# Reliable delivery of host/security notifications through the outbox table
+outbox_relay = OutboxRelay(
+    max_attempts=int(os.getenv('OUTBOX_MAX_ATTEMPTS', 8)),
+    base_delay=float(os.getenv('OUTBOX_BASE_DELAY', 2)),
+    max_delay=float(os.getenv('OUTBOX_MAX_DELAY', 600)),
+    poll_interval=float(os.getenv('OUTBOX_POLL_INTERVAL', 5)),
+    retention_days=int(os.getenv('OUTBOX_RETENTION_DAYS', 7)),
+)
+
+@app.before_request
+def start_outbox_relay():
+    # Starts the poller once per worker process (cheap pid check afterwards)
+    outbox_relay.ensure_started()
+
+def detached_copy(visitor):
+    """Plain copy of a Visitor row that is not bound to any database session"""
+    return Visitor(**{column.name: getattr(visitor, column.name) for column in Visitor.__table__.columns})
+
+def send_host_digest(host_phone, items):
+    """Flush callback for the host digest: one outbox message for everything buffered.
+
+    ``items`` are (visitor, outbox ids) pairs. Each visitor's own notification
+    was written to the outbox when it registered, held back for
+    HOST_DIGEST_HOLD seconds. A lone visitor's rows are simply released; for a
+    group they are marked 'merged' in the same transaction that adds the
+    digest. If the worker dies before the flush, the held rows become due on
+    their own and any worker's poller sends them one by one.
+    """
+    visitors = [visitor for visitor, _ in items]
+    held_ids = [outbox_id for _, outbox_ids in items for outbox_id in outbox_ids]
+    with app.app_context():
+        if len(visitors) == 1:
+            db.session.execute(outbox_relay.release(held_ids))
+            outbox_ids = held_ids
+        else:
+            db.session.execute(outbox_relay.merge(held_ids))
+            outbox_ids = outbox_relay.enqueue('host', *group_host_notification(visitors))
+        db.session.commit()
+    outbox_relay.kick(outbox_ids)
+
+# Optional per-host digest of host notifications (HOST_DIGEST_WINDOW > 0).
+# Created after the dispatcher so buffered digests are flushed before it drains.
+host_digest = coalescer_from_env(send_host_digest)
+# How long digest-mode host rows wait in the outbox before a poller may send
+# them individually: the latest a digest can flush, plus a margin
+HOST_DIGEST_HOLD = host_digest.max_delay + outbox_relay.lease if host_digest is not None else 0.0
 
 def visitor_form_template():
     return '''
@@ -192,43 +1129,77 @@ def security_dashboard_template():
     </div>
 
     <script>
-        // Load visitors on page load
+        // Load visitors on page load, then follow the live feed
         window.onload = loadVisitors;
         
+        var eventSource = null;
+        
+        // Last body and ETag per URL; unchanged data comes back as a bodiless 304
+        var jsonCache = {};
+        
+        async function fetchJson(url) {
+            var cached = jsonCache[url];
+            var response = await fetch(url, {
+                cache: 'no-store',
+                headers: cached ? {'If-None-Match': cached.etag} : {}
+            });
+            if (response.status === 304 && cached) return cached.data;
+            var data = await response.json();
+            var etag = response.headers.get('ETag');
+            if (etag) jsonCache[url] = {etag: etag, data: data};
+            return data;
+        }
+        
         async function loadVisitors() {
             try {
-                const response = await fetch('/api/security/notifications');
-                const visitors = await response.json();
+                const visitors = await fetchJson('/api/security/notifications');
                 
                 const container = document.getElementById('visitorsContainer');
                 container.innerHTML = '';
                 
                 if (visitors.length === 0) {
                     container.innerHTML = '<p>\\u6682\\u65e0\\u8bbf\\u5ba2\\u4fe1\\u606f</p>';
-                    return;
+                } else {
+                    visitors.forEach(function(visitor) {
+                        container.appendChild(createCard(visitor));
+                    });
                 }
                 
-                visitors.forEach(function(visitor) {
-                    var card = document.createElement('div');
-                    card.className = 'visitor-card ' + visitor.status;
-                    
-                    card.innerHTML = 
-                        '<h3>\\u8bbf\\u5ba2: ' + visitor.name + '</h3>' +
-                        '<p><strong>\\u7535\\u8bdd:</strong> ' + visitor.phone + '</p>' +
-                        '<p><strong>\\u5355\\u4f4d:</strong> ' + visitor.company + '</p>' +
-                        '<p><strong>\\u88ab\\u62dc\\u8bbf\\u4eba:</strong> ' + visitor.host_name + '</p>' +
-                        '<p><strong>\\u9884\\u7ea6\\u65f6\\u95f4:</strong> ' + new Date(visitor.visit_time).toLocaleString() + '</p>' +
-                        '<p><strong>\\u72b6\\u6001:</strong> <span class="status-' + visitor.status + '">' + getStatusText(visitor.status) + '</span></p>' +
-                        '<p><strong>\\u8bbf\\u5ba2ID:</strong> ' + visitor.id + '</p>';
-                    
-                    container.appendChild(card);
-                });
+                // Resume the stream right after the newest entry we already show
+                var lastEventId = visitors.reduce(function(max, v) { return Math.max(max, v.event_id || 0); }, 0);
+                subscribe(lastEventId);
             } catch (error) {
                 console.error('Error loading visitors:', error);
                 document.getElementById('visitorsContainer').innerHTML = '<p>\\u52a0\\u8f7d\\u8bbf\\u5ba2\\u4fe1\\u606f\\u5931\\u8d25</p>';
             }
         }
         
+        function subscribe(lastEventId) {
+            if (eventSource) eventSource.close();
+            // EventSource reconnects on its own and sends Last-Event-ID itself
+            eventSource = new EventSource('/api/security/stream?last_event_id=' + lastEventId);
+            eventSource.addEventListener('notification', function(e) {
+                var container = document.getElementById('visitorsContainer');
+                if (!container.querySelector('.visitor-card')) container.innerHTML = '';
+                container.insertBefore(createCard(JSON.parse(e.data)), container.firstChild);
+            });
+        }
+        
+        function createCard(visitor) {
+            var card = document.createElement('div');
+            card.className = 'visitor-card ' + visitor.status;
+            
+            card.innerHTML = 
+                '<h3>\\u8bbf\\u5ba2: ' + (visitor.visitor_name || visitor.name) + '</h3>' +
+                '<p><strong>\\u7535\\u8bdd:</strong> ' + (visitor.visitor_phone || visitor.phone) + '</p>' +
+                '<p><strong>\\u5355\\u4f4d:</strong> ' + (visitor.visitor_company || visitor.company) + '</p>' +
+                '<p><strong>\\u88ab\\u62dc\\u8bbf\\u4eba:</strong> ' + visitor.host_name + '</p>' +
+                '<p><strong>\\u9884\\u7ea6\\u65f6\\u95f4:</strong> ' + new Date(visitor.visit_time).toLocaleString() + '</p>' +
+                '<p><strong>\\u72b6\\u6001:</strong> <span class="status-' + visitor.status + '">' + getStatusText(visitor.status) + '</span></p>' +
+                '<p><strong>\\u8bbf\\u5ba2ID:</strong> ' + (visitor.visitor_id || visitor.id) + '</p>';
+            return card;
+        }
+        
         function getStatusText(status) {
             switch(status) {
                 case 'approved': return '\\u5df2\\u6279\\u51c6';
@@ -271,6 +1242,7 @@ def host_confirmation_template():
         .approve-btn { background-color: #28a745; color: white; }
         .deny-btn { background-color: #dc3545; color: white; }
         .refresh-btn { background-color: #007bff; color: white; }
+        .host-phone input { padding: 8px; border: 1px solid #ddd; border-radius: 4px; font-size: 16px; margin-right: 10px; }
         .message { padding: 10px; margin: 10px 0; border-radius: 4px; display: none; }
         .success { background-color: #d4edda; color: #155724; border: 1px solid #c3e6cb; }
         .error { background-color: #f8d7da; color: #721c24; border: 1px solid #f5c6cb; }
@@ -281,6 +1253,12 @@ def host_confirmation_template():
         <h1>访客确认系统</h1>
         <p>请确认访客预约请求</p>
         
+        <div class="host-phone">
+            <label for="hostPhone">被拜访人电话号码:</label>
+            <input type="tel" id="hostPhone">
+            <button class="refresh-btn" onclick="setHostPhone()">查看</button>
+        </div>
+        
         <div id="message" class="message"></div>
         
         <div id="visitorsContainer">
@@ -293,25 +1271,61 @@ def host_confirmation_template():
     </div>
 
     <script>
+        // Host phone comes from ?host_phone= or the last value entered on this device
+        var hostPhone = new URLSearchParams(window.location.search).get('host_phone') || localStorage.getItem('hostPhone') || '';
+        
         // Load visitors on page load
-        window.onload = loadVisitors;
+        window.onload = function() {
+            document.getElementById('hostPhone').value = hostPhone;
+            loadVisitors();
+        };
+        
+        function setHostPhone() {
+            hostPhone = document.getElementById('hostPhone').value.trim();
+            localStorage.setItem('hostPhone', hostPhone);
+            loadVisitors();
+        }
+        
+        // Last body and ETag per URL; unchanged data comes back as a bodiless 304
+        var jsonCache = {};
+        
+        async function fetchJson(url) {
+            var cached = jsonCache[url];
+            var response = await fetch(url, {
+                cache: 'no-store',
+                headers: cached ? {'If-None-Match': cached.etag} : {}
+            });
+            if (response.status === 304 && cached) return cached.data;
+            var data = await response.json();
+            var etag = response.headers.get('ETag');
+            if (etag) jsonCache[url] = {etag: etag, data: data};
+            return data;
+        }
         
         async function loadVisitors() {
+            const container = document.getElementById('visitorsContainer');
+            if (!hostPhone) {
+                container.innerHTML = '<p>\\u8bf7\\u8f93\\u5165\\u88ab\\u62dc\\u8bbf\\u4eba\\u7535\\u8bdd\\u53f7\\u7801</p>';
+                return;
+            }
             try {
-                const response = await fetch('/api/visitors');
-                const visitors = await response.json();
+                // Only this host's pending queue plus a short history, not the whole table
+                const phone = encodeURIComponent(hostPhone);
+                const results = await Promise.all([
+                    fetchJson('/api/hosts/' + phone + '/pending'),
+                    fetchJson('/api/visitors?limit=20&host_phone=' + phone)
+                ]);
+                const visitors = results[0];
+                const recentVisitors = results[1];
                 
-                const container = document.getElementById('visitorsContainer');
                 container.innerHTML = '';
                 
-                if (visitors.length === 0) {
+                if (visitors.length === 0 && recentVisitors.length === 0) {
                     container.innerHTML = '<p>\\u6682\\u65e0\\u8bbf\\u5ba2\\u9884\\u7ea6</p>';
                     return;
                 }
                 
                 visitors.forEach(function(visitor) {
-                    if (visitor.status !== 'pending') return; // Only show pending requests
-                    
                     var card = document.createElement('div');
                     card.className = 'visitor-card ' + visitor.status;
                     
@@ -331,7 +1345,7 @@ def host_confirmation_template():
                 });
                 
                 // Show non-pending visitors separately
-                var nonPendingVisitors = visitors.filter(function(v) { return v.status !== 'pending'; });
+                var nonPendingVisitors = recentVisitors.filter(function(v) { return v.status !== 'pending'; });
                 if (nonPendingVisitors.length > 0) {
                     var historyTitle = document.createElement('h3');
                     historyTitle.textContent = '\\u5386\\u53f2\\u8bb0\\u5f55';
@@ -404,42 +1418,109 @@ def host_confirmation_template():
 </html>
 '''
 
+def precompress_page(html):
+    """Encode a page once into identity/gzip/brotli bodies, each with a strong ETag"""
+    body = html.encode('utf-8')
+    digest = hashlib.sha256(body).hexdigest()[:32]
+    variants = {'identity': (body, digest)}
+    variants['gzip'] = (gzip.compress(body, compresslevel=9, mtime=0), f'{digest}-gzip')
+    if brotli is not None:
+        variants['br'] = (brotli.compress(body, quality=11), f'{digest}-br')
+    return variants
+
+def page_response(variants):
+    """Serve the best precompressed variant the client accepts, answering 304 when unchanged"""
+    encoding = 'identity'
+    for candidate in ('br', 'gzip'):
+        if candidate in variants and request.accept_encodings[candidate]:
+            encoding = candidate
+            break
+
+    body, etag = variants[encoding]
+    response = Response(body, mimetype='text/html')
+    if encoding != 'identity':
+        response.headers['Content-Encoding'] = encoding
+    response.headers['Vary'] = 'Accept-Encoding'
+    response.cache_control.no_cache = True
+    response.set_etag(etag)
+    return response.make_conditional(request)
+
+# Pages are static, so they are built and compressed once at startup
+VISITOR_FORM_PAGE = precompress_page(visitor_form_template())
+SECURITY_DASHBOARD_PAGE = precompress_page(security_dashboard_template())
+HOST_CONFIRMATION_PAGE = precompress_page(host_confirmation_template())
+
 # Main visitor registration page
 @app.route('/')
 def visitor_form():
-    return visitor_form_template()
+    return page_response(VISITOR_FORM_PAGE)
 
 # Security dashboard
 @app.route('/security')
 def security_dashboard():
-    return security_dashboard_template()
+    return page_response(SECURITY_DASHBOARD_PAGE)
 
 # Host confirmation interface
 @app.route('/host')
 def host_confirmation_interface():
-    return host_confirmation_template()
+    return page_response(HOST_CONFIRMATION_PAGE)
 
-# Generate QR code for visitor registration page
-@app.route('/qr')
-def generate_qr():
-    # Generate QR code pointing to the visitor registration page
+# QR code render parameters and their allowed ranges
+QR_BOX_SIZE = 10
+QR_BORDER = 4
+QR_CACHE_MAX_AGE = 86400
+
+@lru_cache(maxsize=32)
+def render_qr(data, image_format='png', box_size=QR_BOX_SIZE, border=QR_BORDER):
+    """Render a QR code once per (data, format, box_size, border).
+
+    Returns ``(image_bytes, etag)``; the URL the QR code encodes is effectively
+    constant, so kiosks refreshing /qr hit this cache instead of re-rendering.
+    """
     qr = qrcode.QRCode(
         version=1,
         error_correction=qrcode.constants.ERROR_CORRECT_L,
-        box_size=10,
-        border=4,
+        box_size=box_size,
+        border=border,
     )
-    # Using the root URL of the current request
-    qr.add_data(request.url_root)
+    qr.add_data(data)
     qr.make(fit=True)
 
-    img = qr.make_image(fill_color="black", back_color="white")
-    
-    # Convert to base64 for display in HTML
     buffer = io.BytesIO()
-    img.save(buffer, format='PNG')
-    img_str = base64.b64encode(buffer.getvalue()).decode()
-    
+    if image_format == 'svg':
+        qr.make_image(image_factory=qrcode.image.svg.SvgPathImage).save(buffer)
+    else:
+        qr.make_image(fill_color="black", back_color="white").save(buffer, format='PNG')
+    image = buffer.getvalue()
+    return image, hashlib.sha1(image).hexdigest()
+
+def qr_image_response(image_format, mimetype):
+    try:
+        box_size = min(max(int(request.args.get('box_size', QR_BOX_SIZE)), 1), 40)
+        border = min(max(int(request.args.get('border', QR_BORDER)), 0), 10)
+    except ValueError:
+        return jsonify({'error': 'box_size and border must be integers'}), 400
+
+    # Using the root URL of the current request
+    image, etag = render_qr(request.url_root, image_format, box_size, border)
+    response = Response(image, mimetype=mimetype)
+    response.set_etag(etag)
+    response.cache_control.public = True
+    response.cache_control.max_age = QR_CACHE_MAX_AGE
+    return response.make_conditional(request)
+
+# QR code image for the visitor registration page
+@app.route('/qr.png')
+def generate_qr_png():
+    return qr_image_response('png', 'image/png')
+
+@app.route('/qr.svg')
+def generate_qr_svg():
+    return qr_image_response('svg', 'image/svg+xml')
+
+# QR code page for the visitor registration page
+@app.route('/qr')
+def generate_qr():
     qr_template = f'''
     <!DOCTYPE html>
     <html>
@@ -456,7 +1537,7 @@ def generate_qr():
         <div class="qr-container">
             <h1>访客登记二维码</h1>
             <p>用微信扫描下方二维码进行访客登记</p>
-            <img src="data:image/png;base64,{img_str}" alt="QR Code" style="width: 300px; height: 300px;">
+            <img src="/qr.png" alt="QR Code" style="width: 300px; height: 300px;">
             <p>扫描二维码或直接访问: {request.url_root}</p>
         </div>
     </body>
@@ -487,76 +1568,122 @@ def register_visitor():
         )
         
         db.session.add(visitor)
+        db.session.flush()
+        visitor_id = visitor.id
+        
+        # Host notification goes into the outbox in the same transaction;
+        # in digest mode it is held until the digest flushes
+        outbox_ids = outbox_relay.enqueue('host', *host_notification(visitor), hold=HOST_DIGEST_HOLD)
+        bump_data_version()
         db.session.commit()
         
-        # Send notification to host for confirmation
-        send_notification_to_host(visitor)
+        if host_digest is not None:
+            host_digest.add(visitor.host_phone, (detached_copy(visitor), outbox_ids))
+        else:
+            outbox_relay.kick(outbox_ids)
         
-        return jsonify({'message': 'Visitor registered successfully', 'id': visitor.id}), 201
+        return jsonify({'message': 'Visitor registered successfully', 'id': visitor_id}), 201
     except Exception as e:
         db.session.rollback()
         return jsonify({'error': str(e)}), 500
 
-def send_notification_to_host(visitor):
-    """Send notification to the host for confirmation via WeChat or DingTalk"""
+# Largest group accepted by the batch registration endpoint
+MAX_BATCH_SIZE = 100
+
+# API endpoint to register a group of visitors for one host in one request
+@app.route('/api/visitors/batch', methods=['POST'])
+def register_visitor_batch():
     try:
-        # Determine which notification service to use based on environment variable
-        notification_service = os.getenv('NOTIFICATION_SERVICE', 'webhook').lower()
+        data = request.get_json()
         
-        message = f'有新的访客预约:\n姓名: {visitor.name}\n电话: {visitor.phone}\n单位: {visitor.company}\n\n请确认是否同意接待，访问ID: {visitor.id}'
+        # Validate the shared host fields and every visitor before inserting anything
+        host_fields = ['host_name', 'host_company', 'host_phone']
+        for field in host_fields:
+            if not data.get(field):
+                return jsonify({'error': f'{field} is required'}), 400
         
-        if notification_service == 'wechat':
-            # WeChat Work notification
-            wechat_webhook = os.getenv('WECHAT_WEBHOOK')
-            if not wechat_webhook:
-                print("WeChat webhook not configured")
-                return
-                
-            payload = {
-                "msgtype": "text",
-                "text": {
-                    "content": message
-                }
-            }
-            response = requests.post(wechat_webhook, json=payload)
-            print(f"WeChat notification sent: {response.status_code}")
-            
-        elif notification_service == 'dingtalk':
-            # DingTalk notification
-            dingtalk_webhook = os.getenv('DINGTALK_WEBHOOK')
-            if not dingtalk_webhook:
-                print("DingTalk webhook not configured")
-                return
-                
-            payload = {
-                "msgtype": "text",
-                "text": {
-                    "content": message
-                }
-            }
-            response = requests.post(dingtalk_webhook, json=payload)
-            print(f"DingTalk notification sent: {response.status_code}")
-            
-        else:
-            # Generic webhook fallback
-            webhook_url = os.getenv('HOST_NOTIFICATION_WEBHOOK', 'https://example.com/webhook')
-            
-            payload = {
-                'text': message,
+        group = data.get('visitors')
+        if not isinstance(group, list) or not group:
+            return jsonify({'error': 'visitors must be a non-empty list'}), 400
+        if len(group) > MAX_BATCH_SIZE:
+            return jsonify({'error': f'at most {MAX_BATCH_SIZE} visitors per batch'}), 400
+        
+        errors = []
+        for index, member in enumerate(group):
+            for field in ['name', 'phone', 'company']:
+                if not isinstance(member, dict) or not member.get(field):
+                    errors.append({'index': index, 'error': f'{field} is required'})
+                    break
+        if errors:
+            return jsonify({'error': 'invalid visitors', 'details': errors}), 400
+        
+        # One transaction; SQLAlchemy batches the rows into multi-row INSERTs
+        visitors = [
+            Visitor(
+                name=member['name'],
+                phone=member['phone'],
+                company=member['company'],
+                host_name=data['host_name'],
+                host_company=data['host_company'],
+                host_phone=data['host_phone']
+            )
+            for member in group
+        ]
+        db.session.add_all(visitors)
+        db.session.flush()
+        visitor_ids = [visitor.id for visitor in visitors]
+        
+        # One consolidated notification for the whole group, in the same transaction
+        outbox_ids = outbox_relay.enqueue('host', *group_host_notification(visitors))
+        bump_data_version()
+        db.session.commit()
+        outbox_relay.kick(outbox_ids)
+        
+        return jsonify({'message': f'{len(visitors)} visitors registered successfully',
+                        'ids': visitor_ids}), 201
+    except Exception as e:
+        db.session.rollback()
+        return jsonify({'error': str(e)}), 500
+
+def host_notification(visitor):
+    """Message and webhook payload asking the host to confirm a visitor"""
+    message = f'有新的访客预约:\n姓名: {visitor.name}\n电话: {visitor.phone}\n单位: {visitor.company}\n\n请确认是否同意接待，访问ID: {visitor.id}'
+    
+    payload = {
+        'text': message,
+        'visitor_id': visitor.id,
+        'visitor_name': visitor.name,
+        'visitor_phone': visitor.phone,
+        'visitor_company': visitor.company,
+        'host_name': visitor.host_name,
+        'host_company': visitor.host_company,
+        'host_phone': visitor.host_phone
+    }
+    return message, payload
+
+def group_host_notification(visitors):
+    """One message and payload listing a whole group of visitors for the same host"""
+    lines = [f'{index}. {visitor.name} ({visitor.company}, {visitor.phone}) 访问ID: {visitor.id}'
+             for index, visitor in enumerate(visitors, 1)]
+    message = f'有新的团体访客预约 ({len(visitors)}人):\n' + '\n'.join(lines) + '\n\n请确认是否同意接待'
+    
+    host = visitors[0]
+    payload = {
+        'text': message,
+        'visitors': [
+            {
                 'visitor_id': visitor.id,
                 'visitor_name': visitor.name,
                 'visitor_phone': visitor.phone,
-                'visitor_company': visitor.company,
-                'host_name': visitor.host_name,
-                'host_company': visitor.host_company,
-                'host_phone': visitor.host_phone
+                'visitor_company': visitor.company
             }
-            
-            response = requests.post(webhook_url, json=payload)
-            print(f"Generic notification sent: {response.status_code}")
-        
-    except Exception as e:
-        print(f"Error sending notification to host: {str(e)}")
+            for visitor in visitors
+        ],
+        'host_name': host.host_name,
+        'host_company': host.host_company,
+        'host_phone': host.host_phone
+    }
+    return message, payload
 
 # API endpoint for host to approve or deny visitor
 @app.route('/api/visitors/<int:visitor_id>/status', methods=['PUT'])
@@ -570,107 +1697,347 @@ def update_visitor_status(visitor_id):
             return jsonify({'error': 'Status must be approved or denied'}), 400
         
         visitor.status = new_status
-        db.session.commit()
         
-        # Send notification to security
-        send_notification_to_security(visitor)
+        # Security notification goes into the outbox in the same transaction
+        outbox_ids = outbox_relay.enqueue('security', *security_notification(visitor))
+        bump_data_version()
+        body = app.json.dumps(visitor.to_dict())
+        db.session.commit()
+        # Refresh this worker's cached copy; other workers catch up within the TTL
+        visitor_cache.put(visitor_id, body)
+        outbox_relay.kick(outbox_ids)
         
         return jsonify({'message': f'Visitor status updated to {new_status}'}), 200
     except Exception as e:
         db.session.rollback()
         return jsonify({'error': str(e)}), 500
 
-def send_notification_to_security(visitor):
-    """Send notification to security app"""
+def security_notification(visitor):
+    """Message and webhook payload telling security about a status change"""
+    message = f'访客状态更新:\n访客姓名: {visitor.name}\n访客电话: {visitor.phone}\n访客单位: {visitor.company}\n被拜访人: {visitor.host_name}\n状态: {visitor.status}\n访客ID: {visitor.id}'
+    
+    payload = {
+        'visitor_name': visitor.name,
+        'visitor_phone': visitor.phone,
+        'visitor_company': visitor.company,
+        'host_name': visitor.host_name,
+        'visit_time': visitor.visit_time.isoformat(),
+        'status': visitor.status,
+        'visitor_id': visitor.id
+    }
+    return message, payload
+
+def versioned_etag(*parts):
+    """Strong ETag for a response that only depends on ``parts`` (version, URL, ...)"""
+    return hashlib.sha1('|'.join(str(part) for part in parts).encode()).hexdigest()
+
+def not_modified(etag):
+    response = Response(status=304)
+    response.set_etag(etag)
+    response.headers['Cache-Control'] = 'no-cache'
+    return response
+
+def with_etag(response, etag):
+    response.set_etag(etag)
+    # Let clients keep the body but revalidate it on every use
+    response.headers['Cache-Control'] = 'no-cache'
+    return response
+
+# Page size limits for visitor listings
+DEFAULT_PAGE_SIZE = 100
+MAX_PAGE_SIZE = 500
+# Rows fetched and encoded per batch by ?stream=1 listings
+STREAM_BATCH_SIZE = int(os.getenv('VISITOR_STREAM_BATCH_SIZE', 1000))
+
+def encode_cursor(visitor):
+    """Opaque keyset cursor pointing just past ``visitor`` in (visit_time, id) order"""
+    raw = f'{visitor.visit_time.isoformat()}|{visitor.id}'
+    return base64.urlsafe_b64encode(raw.encode()).decode().rstrip('=')
+
+def decode_cursor(cursor):
+    padded = cursor + '=' * (-len(cursor) % 4)
+    visit_time, visitor_id = base64.urlsafe_b64decode(padded.encode()).decode().split('|')
+    return datetime.fromisoformat(visit_time), int(visitor_id)
+
+def parse_listing_args(args):
+    """Parse limit/cursor/status/host_phone/since/until query parameters.
+
+    Raises ValueError with a message suitable for a 400 response.
+    """
     try:
-        # Determine which notification service to use for security
-        security_notification_service = os.getenv('SECURITY_NOTIFICATION_SERVICE', 'webhook').lower()
-        
-        message = f'访客状态更新:\n访客姓名: {visitor.name}\n访客电话: {visitor.phone}\n访客单位: {visitor.company}\n被拜访人: {visitor.host_name}\n状态: {visitor.status}\n访客ID: {visitor.id}'
-        
-        if security_notification_service == 'wechat':
-            # WeChat Work notification for security
-            wechat_webhook = os.getenv('SECURITY_WECHAT_WEBHOOK')
-            if not wechat_webhook:
-                print("Security WeChat webhook not configured")
-                return
-                
-            payload = {
-                "msgtype": "text",
-                "text": {
-                    "content": message
-                }
-            }
-            response = requests.post(wechat_webhook, json=payload)
-            print(f"Security WeChat notification sent: {response.status_code}")
-            
-        elif security_notification_service == 'dingtalk':
-            # DingTalk notification for security
-            dingtalk_webhook = os.getenv('SECURITY_DINGTALK_WEBHOOK')
-            if not dingtalk_webhook:
-                print("Security DingTalk webhook not configured")
-                return
-                
-            payload = {
-                "msgtype": "text",
-                "text": {
-                    "content": message
-                }
-            }
-            response = requests.post(dingtalk_webhook, json=payload)
-            print(f"Security DingTalk notification sent: {response.status_code}")
-            
-        elif security_notification_service == 'app':
-            # Add to in-memory security notifications
-            notification_data = {
-                'visitor_name': visitor.name,
-                'visitor_phone': visitor.phone,
-                'visitor_company': visitor.company,
-                'host_name': visitor.host_name,
-                'visit_time': visitor.visit_time.isoformat(),
-                'status': visitor.status,
-                'visitor_id': visitor.id,
-                'timestamp': datetime.now().isoformat()
-            }
-            
-            # In a real app, you would store this in a database
-            # For this demo, we're using an in-memory list
-            global security_notifications
-            security_notifications.append(notification_data)
-            
-            print(f"Notification added to security app: visitor {visitor.id}, status: {visitor.status}")
-            
-        else:
-            # Generic webhook fallback for security
-            webhook_url = os.getenv('SECURITY_NOTIFICATION_WEBHOOK', 'https://example.com/security_webhook')
-            
-            payload = {
-                'visitor_name': visitor.name,
-                'visitor_phone': visitor.phone,
-                'visitor_company': visitor.company,
-                'host_name': visitor.host_name,
-                'visit_time': visitor.visit_time.isoformat(),
-                'status': visitor.status,
-                'visitor_id': visitor.id
-            }
-            
-            response = requests.post(webhook_url, json=payload)
-            print(f"Security notification sent to webhook: {response.status_code}")
-        
-    except Exception as e:
-        print(f"Error sending notification to security: {str(e)}")
+        limit = int(args.get('limit', DEFAULT_PAGE_SIZE))
+    except ValueError:
+        raise ValueError('limit must be an integer')
+    if limit < 1:
+        raise ValueError('limit must be positive')
+
+    cursor = None
+    if args.get('cursor'):
+        try:
+            cursor = decode_cursor(args['cursor'])
+        except Exception:
+            raise ValueError('invalid cursor')
+
+    dates = {}
+    for name in ('since', 'until'):
+        if args.get(name):
+            try:
+                dates[name] = datetime.fromisoformat(args[name])
+            except ValueError:
+                raise ValueError(f'{name} must be an ISO 8601 date or datetime')
+
+    return {
+        'limit': min(limit, MAX_PAGE_SIZE),
+        'cursor': cursor,
+        'status': args.get('status'),
+        'host_phone': args.get('host_phone'),
+        'since': dates.get('since'),
+        'until': dates.get('until'),
+    }
+
+def visitor_listing_query(status=None, host_phone=None, since=None, until=None, cursor=None, model=Visitor):
+    """Newest-first visitor query with all filters evaluated in SQL.
+
+    ``model`` is Visitor (hot table) or VisitorArchive.
+    """
+    query = model.query
+    if status:
+        query = query.filter(model.status == status)
+    if host_phone:
+        query = query.filter(model.host_phone == host_phone)
+    if since:
+        query = query.filter(model.visit_time >= since)
+    if until:
+        query = query.filter(model.visit_time < until)
+    if cursor:
+        visit_time, visitor_id = cursor
+        # Row-value comparison so the (visit_time, id) index can seek to the cursor
+        query = query.filter(tuple_(model.visit_time, model.id) < (visit_time, visitor_id))
+    return query.order_by(model.visit_time.desc(), model.id.desc())
+
+def visitor_history(params, limit=None, oldest_first=False, stream=False):
+    """Visitors matching ``params`` from both the hot and the archive table.
+
+    Each table is read in index order (at most ``limit`` rows each, through a
+    server-side cursor when ``stream``) and the two sorted streams are merged.
+    The hot table is queried first, so a row archived in between can only
+    show up twice, next to itself, and is skipped the second time.
+    """
+    sources = []
+    for model in (Visitor, VisitorArchive):
+        query = visitor_listing_query(model=model, **params)
+        if oldest_first:
+            query = query.order_by(None).order_by(model.visit_time, model.id)
+        if limit is not None:
+            query = query.limit(limit)
+        sources.append(query.yield_per(STREAM_BATCH_SIZE) if stream else query.all())
+
+    def merged():
+        last_id = None
+        for visitor in heapq.merge(*sources, key=lambda v: (v.visit_time, v.id), reverse=not oldest_first):
+            if visitor.id != last_id:
+                yield visitor
+            last_id = visitor.id
+
+    return islice(merged(), limit)
+
+def iter_batches(rows):
+    """``rows`` in lists of STREAM_BATCH_SIZE"""
+    rows = iter(rows)
+    while True:
+        batch = list(islice(rows, STREAM_BATCH_SIZE))
+        if not batch:
+            return
+        yield batch
+
+def stream_visitor_listing(rows):
+    """JSON array of ``rows``, fetched and encoded one batch at a time.
+
+    Rows come from a server-side cursor (``yield_per``) and each batch is sent
+    as soon as it is encoded, so memory stays flat however many rows match.
+    """
+    dumps = app.json.dumps
+
+    def generate():
+        yield '['
+        separator = ''
+        for batch in iter_batches(rows):
+            yield separator + ','.join(dumps(visitor.to_dict()) for visitor in batch)
+            separator = ','
+        yield ']'
+
+    return Response(stream_with_context(generate()), mimetype='application/json')
 
 # API to get all visitors (for admin/security interface)
+# Paginated by keyset: pass the X-Next-Cursor header back as ?cursor= for the next page.
+# ?stream=1 returns every matching row in one streamed response instead (admin exports)
 @app.route('/api/visitors', methods=['GET'])
+@read_replica
 def get_all_visitors():
-    visitors = Visitor.query.order_by(Visitor.visit_time.desc()).all()
-    return jsonify([visitor.to_dict() for visitor in visitors])
+    try:
+        params = parse_listing_args(request.args)
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+
+    # Read the version before the rows, so the ETag can only be older than the body
+    etag = versioned_etag(data_version(), request.full_path)
+    if request.if_none_match.contains(etag):
+        return not_modified(etag)
+
+    limit = params.pop('limit')
+    if request.args.get('stream') in ('1', 'true'):
+        # An explicit limit is honoured as is; MAX_PAGE_SIZE only bounds buffered pages
+        stream_limit = int(request.args['limit']) if 'limit' in request.args else None
+        return with_etag(stream_visitor_listing(visitor_history(params, limit=stream_limit, stream=True)), etag)
+
+    # Fetch one extra row to learn whether another page exists
+    visitors = list(visitor_history(params, limit=limit + 1))
+    has_more = len(visitors) > limit
+    visitors = visitors[:limit]
+
+    response = jsonify([visitor.to_dict() for visitor in visitors])
+    if has_more:
+        next_cursor = encode_cursor(visitors[-1])
+        response.headers['X-Next-Cursor'] = next_cursor
+        next_args = request.args.to_dict()
+        next_args['cursor'] = next_cursor
+        response.headers['Link'] = f'<{request.base_url}?{urlencode(next_args)}>; rel="next"'
+    return with_etag(response, etag)
+
+EXPORT_FIELDS = ['id', 'name', 'phone', 'company', 'host_name', 'host_company', 'host_phone',
+                 'visit_time', 'status']
+
+def csv_safe(value):
+    """Stop spreadsheet apps from treating visitor-entered text as a formula"""
+    if isinstance(value, str) and value[:1] in ('=', '+', '-', '@', '\t', '\r'):
+        return "'" + value
+    return value
+
+def export_csv(rows):
+    """CSV with a UTF-8 BOM (so Excel reads the Chinese fields), one chunk per batch"""
+    def generate():
+        buffer = io.StringIO()
+        writer = csv.writer(buffer)
+        buffer.write('\ufeff')
+        writer.writerow(EXPORT_FIELDS)
+        for batch in iter_batches(rows):
+            for visitor in batch:
+                row = visitor.to_dict()
+                writer.writerow([csv_safe(row[field]) for field in EXPORT_FIELDS])
+            yield buffer.getvalue()
+            buffer.seek(0)
+            buffer.truncate()
+        yield buffer.getvalue()
+    return generate()
+
+def export_ndjson(rows):
+    """One JSON object per line, one chunk per batch"""
+    dumps = app.json.dumps
+
+    def generate():
+        for batch in iter_batches(rows):
+            yield ''.join(dumps(visitor.to_dict()) + '\n' for visitor in batch)
+    return generate()
+
+EXPORT_FORMATS = {
+    'csv': (export_csv, 'text/csv'),
+    'ndjson': (export_ndjson, 'application/x-ndjson'),
+}
+
+# Visitor log export for audits: every visitor in a date range, oldest first.
+# ?format=csv (default) or ndjson, plus since/until/status/host_phone as for the listing
+@app.route('/api/visitors/export', methods=['GET'])
+@read_replica
+def export_visitors():
+    export_format = request.args.get('format', 'csv')
+    if export_format not in EXPORT_FORMATS:
+        return jsonify({'error': 'format must be csv or ndjson'}), 400
+    try:
+        params = parse_listing_args(request.args)
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+    params.pop('limit')
+    params.pop('cursor')
+
+    encode, mimetype = EXPORT_FORMATS[export_format]
+    period = '_'.join(params[name].date().isoformat() for name in ('since', 'until') if params[name])
+    filename = f"visitors{'_' + period if period else ''}.{export_format}"
+    rows = visitor_history(params, oldest_first=True, stream=True)
+    return Response(stream_with_context(encode(rows)), mimetype=mimetype,
+                    headers={'Content-Disposition': f'attachment; filename="{filename}"'})
+
+# API for the host page: only this host's pending visitors, oldest first
+@app.route('/api/hosts/<host_phone>/pending', methods=['GET'])
+def get_host_pending_visitors(host_phone):
+    etag = versioned_etag(data_version(), request.path)
+    if request.if_none_match.contains(etag):
+        return not_modified(etag)
+
+    visitors = (Visitor.query
+                .filter(Visitor.host_phone == host_phone, Visitor.status == 'pending')
+                .order_by(Visitor.visit_time, Visitor.id)
+                .limit(MAX_PAGE_SIZE)
+                .all())
+    return with_etag(jsonify([visitor.to_dict() for visitor in visitors]), etag)
+
+# Serialised visitor records by id, so a visitor polling their own status
+# is answered without a database round trip
+visitor_cache = TTLCache(maxsize=int(os.getenv('VISITOR_CACHE_SIZE', 1024)),
+                         ttl=float(os.getenv('VISITOR_CACHE_TTL', 5)))
 
 # API to get a specific visitor
 @app.route('/api/visitors/<int:visitor_id>', methods=['GET'])
+@read_replica
 def get_visitor(visitor_id):
-    visitor = Visitor.query.get_or_404(visitor_id)
-    return jsonify(visitor.to_dict())
+    body = visitor_cache.get(visitor_id)
+    if body is None:
+        visitor = db.session.get(Visitor, visitor_id) or db.session.get(VisitorArchive, visitor_id)
+        if visitor is None and g.get('use_replica'):
+            # Possibly registered a moment ago and not replicated yet
+            g.use_replica = False
+            visitor = db.session.get(Visitor, visitor_id)
+        if visitor is None:
+            abort(404)
+        body = app.json.dumps(visitor.to_dict())
+        visitor_cache.put(visitor_id, body)
+
+    # Content-based ETag, so a cached record needs no version lookup either
+    etag = hashlib.sha1(body.encode()).hexdigest()
+    if request.if_none_match.contains(etag):
+        return not_modified(etag)
+    return with_etag(Response(body, mimetype='application/json'), etag)
+
+# Queue, feed and digest sizes, read at scrape time
+metrics.gauge('notification_queue_depth', 'Notification jobs waiting in the dispatch queue',
+              lambda: notification_dispatcher.depth())
+metrics.gauge('notification_jobs', 'Notification jobs by result since worker start',
+              lambda: {(name,): notification_dispatcher.stats()[name]
+                       for name in ('submitted', 'completed', 'failed', 'inline')}, ['result'])
+metrics.gauge('security_feed_last_event_id', 'Event id of the newest security notification',
+              lambda: security_notifications.last_event_id)
+metrics.gauge('notification_outbox_rows', 'Outbox rows by delivery status',
+              lambda: {(status,): count for status, count in outbox_relay.stats().items()
+                       if status != 'oldest_pending_seconds'}, ['status'])
+metrics.gauge('visitor_cache_lookups', 'Visitor record cache lookups by result since worker start',
+              lambda: {(result,): visitor_cache.stats()[result] for result in ('hits', 'misses')}, ['result'])
+metrics.gauge('visitor_cache_entries', 'Visitor records held in the cache',
+              lambda: len(visitor_cache))
+metrics.gauge('host_digest_buffered', 'Host notifications waiting in digest buffers',
+              lambda: host_digest.stats()['buffered_items'] if host_digest is not None else None)
+
+@app.route('/metrics')
+def get_metrics():
+    return Response(metrics.render(), mimetype='text/plain; version=0.0.4')
+
+# Notification queue depth and drain time
+@app.route('/api/notifications/stats', methods=['GET'])
+def get_notification_stats():
+    stats = notification_dispatcher.stats()
+    stats['notifiers'] = notifiers.stats()
+    stats['outbox'] = outbox_relay.stats()
+    if host_digest is not None:
+        stats['host_digest'] = host_digest.stats()
+    return jsonify(stats)
 
 # Security app API endpoints
 @app.route('/api/security/notifications', methods=['POST'])
@@ -683,21 +2050,63 @@ def receive_security_notification():
         data['timestamp'] = datetime.now().isoformat()
         
         # Store the notification
-        global security_notifications
         security_notifications.append(data)
         
         return jsonify({'message': 'Notification received successfully'}), 201
     except Exception as e:
         return jsonify({'error': str(e)}), 500
 
-# API to get all security notifications
+# Server-Sent Events feed of new security notifications.
+# Reconnecting clients resume from the Last-Event-ID header (or ?last_event_id=).
+@app.route('/api/security/stream', methods=['GET'])
+def stream_security_notifications():
+    last_event_id = request.headers.get('Last-Event-ID') or request.args.get('last_event_id')
+    newest_event_id = security_notifications.last_event_id
+    try:
+        # An id beyond the newest one comes from a database that was since reset
+        last_event_id = min(int(last_event_id), newest_event_id)
+    except (TypeError, ValueError):
+        # New subscribers only get notifications added from now on
+        last_event_id = newest_event_id
+
+    def generate(event_id):
+        yield 'retry: 3000\n\n'
+        deadline = time.monotonic() + SECURITY_STREAM_MAX_AGE
+        while True:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                return
+            records = security_notifications.after(event_id, timeout=min(SECURITY_STREAM_KEEPALIVE, remaining))
+            if not records:
+                yield ': keep-alive\n\n'
+                continue
+            for record in records:
+                event_id = record.event_id
+                yield f"id: {event_id}\nevent: notification\ndata: {record.payload}\n\n"
+
+    return Response(generate(last_event_id), mimetype='text/event-stream',
+                    headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'})
+
+# API to get security notifications, newest first (already in order, no sorting)
+# ?since=<event_id> returns only newer entries, ?limit= caps the count
 @app.route('/api/security/notifications', methods=['GET'])
 def get_security_notifications():
-    # Sort by timestamp, newest first
-    sorted_notifications = sorted(security_notifications, 
-                                 key=lambda x: x.get('timestamp', ''), 
-                                 reverse=True)
-    return jsonify(sorted_notifications)
+    try:
+        since = int(request.args.get('since', 0))
+        limit = int(request.args['limit']) if 'limit' in request.args else None
+    except ValueError:
+        return jsonify({'error': 'since and limit must be integers'}), 400
+    if limit is not None and limit < 1:
+        return jsonify({'error': 'limit must be positive'}), 400
+
+    # Entries are only ever appended, so the newest event id versions the feed
+    etag = versioned_etag(data_version('security_feed'), request.full_path)
+    if request.if_none_match.contains(etag):
+        return not_modified(etag)
+
+    # Entries are stored pre-encoded, so the body is assembled without re-serialising
+    payloads = security_notifications.newest(limit=limit, since=since)
+    return with_etag(Response('[' + ','.join(payloads) + ']', mimetype='application/json'), etag)
 
 if __name__ == '__main__':
     # Use PORT environment variable for Heroku, default to 5000
@@ -0,0 +1,547 @@
+import asyncio
+import atexit
+import os
+import queue
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from urllib.parse import urlsplit
+
+import requests
+from requests.adapters import HTTPAdapter
+
+try:
+    import httpx
+except ImportError:  # only needed by the ASGI app
+    httpx = None
+
+
+class NotificationDispatcher:
+    """Bounded in-process queue drained by a small pool of worker threads.
+
+    Notification jobs are accepted after the database commit and sent in the
+    background, so the request returns without waiting on WeChat/DingTalk or
+    webhook round trips. When the queue is full the job runs inline in the
+    caller, which slows that one request down instead of losing the message.
+    """
+
+    def __init__(self, workers=2, maxsize=1000, drain_timeout=10.0):
+        self.workers = workers
+        self.maxsize = maxsize
+        self.drain_timeout = drain_timeout
+        self._queue = queue.Queue(maxsize=maxsize)
+        self._threads = []
+        self._pid = None
+        self._lock = threading.Lock()
+        self._stats_lock = threading.Lock()
+        self._closed = False
+        self.submitted = 0
+        self.completed = 0
+        self.failed = 0
+        self.inline = 0
+        self.last_drain_seconds = None
+
+    def _ensure_started(self):
+        # Threads do not survive a fork, so (re)start them lazily in the
+        # process that actually submits work (e.g. each gunicorn worker).
+        if self._pid == os.getpid():
+            return
+        with self._lock:
+            if self._pid == os.getpid():
+                return
+            self._queue = queue.Queue(maxsize=self.maxsize)
+            self._threads = []
+            for i in range(self.workers):
+                thread = threading.Thread(target=self._run, name=f'notify-{i}', daemon=True)
+                thread.start()
+                self._threads.append(thread)
+            self._pid = os.getpid()
+            self._closed = False
+
+    def _run(self):
+        while True:
+            job = self._queue.get()
+            try:
+                if job is None:
+                    return
+                self._execute(*job)
+            finally:
+                self._queue.task_done()
+
+    def _execute(self, func, args, kwargs):
+        try:
+            func(*args, **kwargs)
+            self._count('completed')
+        except Exception as e:
+            self._count('failed')
+            print(f"Notification job {getattr(func, '__name__', func)} failed: {str(e)}")
+
+    def _count(self, name):
+        with self._stats_lock:
+            setattr(self, name, getattr(self, name) + 1)
+
+    def submit(self, func, *args, **kwargs):
+        """Queue ``func(*args, **kwargs)``; returns False if it ran inline."""
+        self._count('submitted')
+        if self.workers <= 0 or self._closed:
+            self._count('inline')
+            self._execute(func, args, kwargs)
+            return False
+
+        self._ensure_started()
+        try:
+            self._queue.put_nowait((func, args, kwargs))
+            return True
+        except queue.Full:
+            self._count('inline')
+            print("Notification queue full, sending inline")
+            self._execute(func, args, kwargs)
+            return False
+
+    def depth(self):
+        return self._queue.qsize()
+
+    def shutdown(self, timeout=None):
+        """Stop accepting background work and wait for queued jobs to finish."""
+        if self._pid != os.getpid() or self._closed:
+            return True
+        self._closed = True
+        timeout = self.drain_timeout if timeout is None else timeout
+        started = time.monotonic()
+
+        deadline = started + timeout
+        for _ in self._threads:
+            # Sentinels go behind the queued jobs, so everything already
+            # accepted is sent before the workers exit.
+            try:
+                self._queue.put(None, timeout=max(0.0, deadline - time.monotonic()))
+            except queue.Full:
+                break
+        for thread in self._threads:
+            thread.join(max(0.0, deadline - time.monotonic()))
+
+        self.last_drain_seconds = time.monotonic() - started
+        drained = not any(thread.is_alive() for thread in self._threads)
+        if drained:
+            print(f"Notification queue drained in {self.last_drain_seconds:.2f}s")
+        else:
+            print(f"Notification queue not drained after {self.last_drain_seconds:.2f}s, "
+                  f"{self.depth()} jobs left")
+        return drained
+
+    def stats(self):
+        return {
+            'workers': self.workers,
+            'queue_depth': self.depth(),
+            'queue_capacity': self.maxsize,
+            'submitted': self.submitted,
+            'completed': self.completed,
+            'failed': self.failed,
+            'inline': self.inline,
+            'last_drain_seconds': self.last_drain_seconds,
+        }
+
+
+def dispatcher_from_env():
+    """Build the dispatcher from NOTIFICATION_* environment variables."""
+    dispatcher = NotificationDispatcher(
+        workers=int(os.getenv('NOTIFICATION_WORKERS', 2)),
+        maxsize=int(os.getenv('NOTIFICATION_QUEUE_SIZE', 1000)),
+        drain_timeout=float(os.getenv('NOTIFICATION_DRAIN_TIMEOUT', 10)),
+    )
+    atexit.register(dispatcher.shutdown)
+    return dispatcher
+
+
+class NotificationCoalescer:
+    """Buffers notifications per key and releases them as one digest.
+
+    A key's buffer is flushed once no new item has arrived for ``window``
+    seconds, but never later than ``max_delay`` seconds after its first item,
+    and immediately once it holds ``max_batch`` items. ``flush(key, items)``
+    is called from the coalescer's timer thread (or the adding thread for a
+    full batch), so it should hand the actual sending off elsewhere.
+    """
+
+    def __init__(self, flush, window=30.0, max_batch=20, max_delay=120.0):
+        self.flush = flush
+        self.window = window
+        self.max_batch = max(1, max_batch)
+        self.max_delay = max(window, max_delay)
+        self._buffers = {}
+        self._changed = threading.Condition()
+        self._pid = None
+        self.digests = 0
+        self.coalesced = 0
+
+    def _ensure_started(self):
+        if self._pid == os.getpid():
+            return
+        self._pid = os.getpid()
+        self._buffers = {}
+        threading.Thread(target=self._run, name='notify-coalescer', daemon=True).start()
+
+    def add(self, key, item):
+        with self._changed:
+            self._ensure_started()
+            now = time.monotonic()
+            buffer = self._buffers.setdefault(key, {'first': now, 'items': []})
+            buffer['last'] = now
+            buffer['items'].append(item)
+            full = len(buffer['items']) >= self.max_batch
+            if full:
+                del self._buffers[key]
+            else:
+                self._changed.notify()
+        if full:
+            self._release(key, buffer['items'])
+
+    def _deadline(self, buffer):
+        return min(buffer['last'] + self.window, buffer['first'] + self.max_delay)
+
+    def _run(self):
+        while True:
+            with self._changed:
+                now = time.monotonic()
+                due = [key for key, buffer in self._buffers.items() if self._deadline(buffer) <= now]
+                ready = [(key, self._buffers.pop(key)['items']) for key in due]
+                if not ready:
+                    deadlines = [self._deadline(buffer) for buffer in self._buffers.values()]
+                    self._changed.wait(min(deadlines) - now if deadlines else None)
+                    continue
+            for key, items in ready:
+                self._release(key, items)
+
+    def _release(self, key, items):
+        with self._changed:
+            self.digests += 1
+            self.coalesced += len(items)
+        try:
+            self.flush(key, items)
+        except Exception as e:
+            print(f"Error flushing notification digest for {key}: {str(e)}")
+
+    def flush_all(self):
+        """Release every buffered digest now (used on shutdown)."""
+        if self._pid != os.getpid():
+            return
+        with self._changed:
+            ready = [(key, buffer['items']) for key, buffer in self._buffers.items()]
+            self._buffers = {}
+        for key, items in ready:
+            self._release(key, items)
+
+    def stats(self):
+        with self._changed:
+            return {
+                'buffered_keys': len(self._buffers),
+                'buffered_items': sum(len(buffer['items']) for buffer in self._buffers.values()),
+                'digests': self.digests,
+                'coalesced': self.coalesced,
+            }
+
+class NotifierTransport:
+    """Keep-alive HTTP sessions for notification webhooks, one per target host.
+
+    WeChat, DingTalk and the generic webhooks each get their own pooled
+    ``requests.Session``, so repeated notifications reuse open TCP/TLS
+    connections instead of handshaking on every send, and every request is
+    bounded by a connect/read timeout.
+    """
+
+    def __init__(self, connect_timeout=3.05, read_timeout=10.0, pool_connections=4, pool_maxsize=10):
+        self.timeout = (connect_timeout, read_timeout)
+        self.pool_connections = pool_connections
+        self.pool_maxsize = pool_maxsize
+        self._sessions = {}
+        self._pid = os.getpid()
+        self._lock = threading.Lock()
+
+    def session_for(self, url):
+        """Return the shared session for the scheme and host of ``url``."""
+        parts = urlsplit(url)
+        key = (parts.scheme, parts.netloc)
+        with self._lock:
+            if self._pid != os.getpid():
+                # Pooled sockets must not be shared with a forked parent
+                self._sessions = {}
+                self._pid = os.getpid()
+            session = self._sessions.get(key)
+            if session is None:
+                session = requests.Session()
+                adapter = HTTPAdapter(pool_connections=self.pool_connections, pool_maxsize=self.pool_maxsize)
+                session.mount(f'{parts.scheme}://', adapter)
+                self._sessions[key] = session
+            return session
+
+    def post(self, url, **kwargs):
+        kwargs.setdefault('timeout', self.timeout)
+        return self.session_for(url).post(url, **kwargs)
+
+    def close(self):
+        with self._lock:
+            for session in self._sessions.values():
+                session.close()
+            self._sessions = {}
+
+
+class AsyncNotifierTransport:
+    """``NotifierTransport`` for the ASGI app, built on one ``httpx.AsyncClient``.
+
+    The client keeps a keep-alive pool per webhook host. Create and close it
+    on the event loop that uses it.
+    """
+
+    def __init__(self, connect_timeout=3.05, read_timeout=10.0, pool_maxsize=10):
+        if httpx is None:
+            raise RuntimeError('The async app needs httpx: pip install httpx')
+        self.client = httpx.AsyncClient(
+            timeout=httpx.Timeout(read_timeout, connect=connect_timeout),
+            limits=httpx.Limits(max_keepalive_connections=pool_maxsize),
+        )
+
+    async def post(self, url, **kwargs):
+        return await self.client.post(url, **kwargs)
+
+    async def close(self):
+        await self.client.aclose()
+
+
+def async_transport_from_env():
+    """Build the async webhook transport from the same NOTIFICATION_* variables."""
+    return AsyncNotifierTransport(
+        connect_timeout=float(os.getenv('NOTIFICATION_CONNECT_TIMEOUT', 3.05)),
+        read_timeout=float(os.getenv('NOTIFICATION_READ_TIMEOUT', 10)),
+        pool_maxsize=int(os.getenv('NOTIFICATION_POOL_SIZE', 10)),
+    )
+
+
+def transport_from_env():
+    """Build the webhook transport from NOTIFICATION_* environment variables."""
+    transport = NotifierTransport(
+        connect_timeout=float(os.getenv('NOTIFICATION_CONNECT_TIMEOUT', 3.05)),
+        read_timeout=float(os.getenv('NOTIFICATION_READ_TIMEOUT', 10)),
+        pool_connections=int(os.getenv('NOTIFICATION_POOL_CONNECTIONS', 4)),
+        pool_maxsize=int(os.getenv('NOTIFICATION_POOL_SIZE', 10)),
+    )
+    atexit.register(transport.close)
+    return transport
+
+
+def coalescer_from_env(flush):
+    """Build the host digest coalescer, or None when HOST_DIGEST_WINDOW is unset/0."""
+    window = float(os.getenv('HOST_DIGEST_WINDOW', 0))
+    if window <= 0:
+        return None
+    coalescer = NotificationCoalescer(
+        flush,
+        window=window,
+        max_batch=int(os.getenv('HOST_DIGEST_MAX_BATCH', 20)),
+        max_delay=float(os.getenv('HOST_DIGEST_MAX_DELAY', 120)),
+    )
+    atexit.register(coalescer.flush_all)
+    return coalescer
+
+
+class TextWebhookChannel:
+    """WeChat Work / DingTalk robot webhook: posts the message as a text message"""
+
+    def __init__(self, name, url):
+        self.name = name
+        self.url = url
+
+    def send(self, transport, message, payload):
+        return transport.post(self.url, json={"msgtype": "text", "text": {"content": message}})
+
+
+class JsonWebhookChannel:
+    """Generic webhook: posts the structured payload as JSON"""
+
+    def __init__(self, name, url):
+        self.name = name
+        self.url = url
+
+    def send(self, transport, message, payload):
+        return transport.post(self.url, json=payload)
+
+
+class CallbackChannel:
+    """In-process channel, e.g. the security app feed; ``func(message, payload)``"""
+
+    def __init__(self, name, func):
+        self.name = name
+        self.func = func
+
+    def send(self, transport, message, payload):
+        return self.func(message, payload)
+
+
+class NotifierRegistry:
+    """Notification channels per audience ('host', 'security'), built once at startup.
+
+    ``send`` delivers to every channel enabled for the audience at the same
+    time, so enabling a second channel does not add its latency to the first.
+    ``observe(audience, channel, outcome, seconds)`` is called for every send.
+    """
+
+    def __init__(self, transport, observe=None, max_workers=4):
+        self.transport = transport
+        self.observe = observe
+        self.max_workers = max_workers
+        self._channels = {}
+        self._executor = None
+        self._pid = None
+        self._lock = threading.Lock()
+        self._timings = {}
+
+    def register(self, audience, channel):
+        self._channels.setdefault(audience, []).append(channel)
+
+    def channels(self, audience):
+        return list(self._channels.get(audience, []))
+
+    def _fanout_executor(self):
+        with self._lock:
+            if self._pid != os.getpid():
+                self._executor = ThreadPoolExecutor(max_workers=self.max_workers, thread_name_prefix='notify-fanout')
+                self._pid = os.getpid()
+            return self._executor
+
+    def _send_one(self, audience, channel, message, payload):
+        started = time.perf_counter()
+        try:
+            response, error = channel.send(self.transport, message, payload), None
+        except Exception as e:
+            response, error = None, str(e)
+        return self._finish(audience, channel, response, error, started)
+
+    def _finish(self, audience, channel, response, error, started):
+        """Classify, log and time one send; returns (channel, outcome, seconds, error)"""
+        if error is not None:
+            outcome = 'error'
+            print(f"Error sending {audience} notification via {channel.name}: {error}")
+        else:
+            # requests and httpx responses both count 4xx/5xx as failures
+            outcome = 'http_error' if response is not None and response.status_code >= 400 else 'success'
+            if response is not None:
+                print(f"{audience} notification sent via {channel.name}: {response.status_code}")
+                if outcome == 'http_error':
+                    error = f'HTTP {response.status_code}'
+        elapsed = time.perf_counter() - started
+        with self._lock:
+            count, total = self._timings.get((audience, channel.name, outcome), (0, 0.0))
+            self._timings[(audience, channel.name, outcome)] = (count + 1, total + elapsed)
+        if self.observe is not None:
+            self.observe(audience, channel.name, outcome, elapsed)
+        return channel.name, outcome, elapsed, error
+
+    def send(self, audience, message, payload):
+        """Send to all channels of ``audience``; returns [(channel, outcome, seconds)]"""
+        channels = self.channels(audience)
+        if not channels:
+            print(f"No {audience} notification channel configured")
+            return []
+        if len(channels) == 1:
+            return [self._send_one(audience, channels[0], message, payload)[:3]]
+        futures = [self._fanout_executor().submit(self._send_one, audience, channel, message, payload)
+                   for channel in channels]
+        return [future.result()[:3] for future in futures]
+
+    def _channel(self, audience, channel_name):
+        for channel in self._channels.get(audience, []):
+            if channel.name == channel_name:
+                return channel
+        return None
+
+    def send_to(self, audience, channel_name, message, payload):
+        """Send on one named channel; returns (outcome, error message or None)"""
+        channel = self._channel(audience, channel_name)
+        if channel is None:
+            return 'error', f'{audience} channel {channel_name} is not configured'
+        _, outcome, _, error = self._send_one(audience, channel, message, payload)
+        return outcome, error
+
+    async def send_to_async(self, transport, audience, channel_name, message, payload):
+        """``send_to`` for the event loop, with an AsyncNotifierTransport.
+
+        Webhook channels await the async client; in-process callbacks may
+        block (e.g. on the database), so they run in a thread.
+        """
+        channel = self._channel(audience, channel_name)
+        if channel is None:
+            return 'error', f'{audience} channel {channel_name} is not configured'
+        started = time.perf_counter()
+        try:
+            if isinstance(channel, CallbackChannel):
+                response = await asyncio.to_thread(channel.send, transport, message, payload)
+            else:
+                response = await channel.send(transport, message, payload)
+            error = None
+        except Exception as e:
+            response, error = None, str(e)
+        _, outcome, _, error = self._finish(audience, channel, response, error, started)
+        return outcome, error
+
+    def stats(self):
+        with self._lock:
+            return {
+                'channels': {audience: [channel.name for channel in channels]
+                             for audience, channels in self._channels.items()},
+                'sends': [
+                    {'audience': audience, 'channel': channel, 'outcome': outcome,
+                     'count': count, 'total_seconds': total}
+                    for (audience, channel, outcome), (count, total) in sorted(self._timings.items())
+                ],
+            }
+
+
+# Channel name -> (environment variable with the URL, channel class, default URL)
+HOST_CHANNELS = {
+    'wechat': ('WECHAT_WEBHOOK', TextWebhookChannel, None),
+    'dingtalk': ('DINGTALK_WEBHOOK', TextWebhookChannel, None),
+    'webhook': ('HOST_NOTIFICATION_WEBHOOK', JsonWebhookChannel, 'https://example.com/webhook'),
+}
+SECURITY_CHANNELS = {
+    'wechat': ('SECURITY_WECHAT_WEBHOOK', TextWebhookChannel, None),
+    'dingtalk': ('SECURITY_DINGTALK_WEBHOOK', TextWebhookChannel, None),
+    'webhook': ('SECURITY_NOTIFICATION_WEBHOOK', JsonWebhookChannel, 'https://example.com/security_webhook'),
+}
+
+
+def _channel_names(variable, default):
+    names = [name.strip().lower() for name in os.getenv(variable, default).split(',') if name.strip()]
+    return names or [default]
+
+
+def _add_webhook_channels(registry, audience, names, table, extra=None):
+    extra = extra or {}
+    for name in names:
+        if name in extra:
+            registry.register(audience, extra[name])
+            continue
+        # Unknown names fall back to the generic webhook, as before
+        variable, channel_class, default_url = table.get(name, table['webhook'])
+        url = os.getenv(variable, default_url)
+        if not url:
+            print(f"{variable} not configured, {audience} {name} notifications disabled")
+            continue
+        registry.register(audience, channel_class(name if name in table else 'webhook', url))
+
+
+def registry_from_env(transport, observe=None, security_app=None):
+    """Build the notifier registry from NOTIFICATION_SERVICE / SECURITY_NOTIFICATION_SERVICE.
+
+    Both accept a comma-separated list of channels (e.g. ``dingtalk,app``).
+    ``security_app`` is the channel used for ``app``; by default it posts to
+    SECURITY_APP_URL's /api/security/notifications.
+    """
+    registry = NotifierRegistry(transport, observe=observe,
+                                max_workers=int(os.getenv('NOTIFICATION_FANOUT_WORKERS', 4)))
+    _add_webhook_channels(registry, 'host', _channel_names('NOTIFICATION_SERVICE', 'webhook'), HOST_CHANNELS)
+
+    if security_app is None:
+        security_app_url = os.getenv('SECURITY_APP_URL', 'http://localhost:5001')
+        security_app = JsonWebhookChannel('app', f'{security_app_url}/api/security/notifications')
+    _add_webhook_channels(registry, 'security', _channel_names('SECURITY_NOTIFICATION_SERVICE', 'webhook'),
+                          SECURITY_CHANNELS, extra={'app': security_app})
+    return registry
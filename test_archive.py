@@ -0,0 +1,123 @@
+import os
+import tempfile
+
+# Point the app at a throwaway database before it is imported
+os.environ['DATABASE_URL'] = 'sqlite:///' + os.path.join(tempfile.mkdtemp(), 'visitors.db')
+
+import csv
+import io
+from datetime import datetime, timedelta
+
+import main
+from main import JobLease, Visitor, VisitorArchive, db
+
+
+def seed_visitors(ages_in_days):
+    """One visitor per age, oldest first; returns their ids"""
+    with main.app.app_context():
+        db.session.query(Visitor).delete()
+        db.session.query(VisitorArchive).delete()
+        now = datetime.utcnow()
+        visitors = [Visitor(name=f'访客{index}', phone='13800138000', company='测试公司',
+                            host_name='被拜访人', host_company='接待单位', host_phone='13900139000',
+                            visit_time=now - timedelta(days=age, minutes=index))
+                    for index, age in enumerate(ages_in_days)]
+        db.session.add_all(visitors)
+        db.session.commit()
+        main.visitor_cache.clear()
+        return [visitor.id for visitor in visitors]
+
+
+def table_ids(model):
+    with main.app.app_context():
+        return sorted(db.session.execute(db.select(model.id)).scalars())
+
+
+def archiver(batch_size=3):
+    return main.VisitorArchiver(retention_days=365, batch_size=batch_size)
+
+
+def test_batches_move_oldest_first_and_resume():
+    ids = seed_visitors([900, 800, 700, 600, 500, 400, 400, 10, 1])
+    old_ids = ids[:7]
+
+    with main.app.app_context():
+        assert archiver().run_once(max_batches=1) == 3
+    assert table_ids(VisitorArchive) == old_ids[:3]
+
+    # A later run carries on where the first one stopped
+    with main.app.app_context():
+        assert archiver().run_once(max_batches=1) == 3
+        assert archiver().run_once() == 1
+        assert archiver().run_once() == 0
+    assert table_ids(VisitorArchive) == old_ids
+    assert table_ids(Visitor) == ids[7:]
+
+    with main.app.app_context():
+        archived = db.session.get(VisitorArchive, old_ids[0])
+        assert (archived.name, archived.host_phone) == ('访客0', '13900139000')
+
+
+def test_newest_visitor_always_stays_in_the_hot_table():
+    ids = seed_visitors([900, 800, 700])
+
+    with main.app.app_context():
+        assert archiver().run_once() == 2
+
+    assert table_ids(Visitor) == [ids[-1]]
+
+
+def test_reads_merge_archived_and_hot_rows():
+    ids = seed_visitors([900, 800, 700, 600, 10, 1])
+    client = main.app.test_client()
+    listing_before = client.get('/api/visitors').get_json()
+    export_before = client.get('/api/visitors/export?format=ndjson').get_data(as_text=True)
+
+    with main.app.app_context():
+        assert archiver().run_once() == 4
+    main.visitor_cache.clear()
+
+    assert client.get('/api/visitors').get_json() == listing_before
+    assert client.get('/api/visitors/export?format=ndjson').get_data(as_text=True) == export_before
+
+    # Pages continue across the boundary between the two tables
+    first = client.get('/api/visitors?limit=3')
+    second = client.get(f"/api/visitors?limit=3&cursor={first.headers['X-Next-Cursor']}")
+    assert [v['id'] for v in first.get_json() + second.get_json()] == ids[::-1]
+
+    rows = list(csv.DictReader(io.StringIO(client.get('/api/visitors/export').get_data(as_text=True).lstrip('﻿'))))
+    assert [int(row['id']) for row in rows] == ids
+
+    response = client.get(f'/api/visitors/{ids[0]}')
+    assert response.status_code == 200
+    assert response.get_json()['name'] == '访客0'
+
+
+def test_only_the_lease_holder_archives_in_the_background():
+    seed_visitors([900, 800, 1])
+    with main.app.app_context():
+        db.session.query(JobLease).delete()
+        db.session.commit()
+    first, second = archiver(), archiver()
+    first.interval = second.interval = 60
+    first.holder, second.holder = 'host:1', 'host:2'
+
+    assert first.run_if_leased() == 2
+    assert second.run_if_leased() is None
+    # The holder renews its own lease
+    assert first.run_if_leased() == 0
+
+    # Once the holder stops renewing, another worker takes over
+    with main.app.app_context():
+        db.session.get(JobLease, 'archive-visitors').expires_at = datetime.utcnow() - timedelta(seconds=1)
+        db.session.commit()
+    assert second.run_if_leased() == 0
+    assert first.run_if_leased() is None
+
+
+if __name__ == "__main__":
+    test_batches_move_oldest_first_and_resume()
+    test_newest_visitor_always_stays_in_the_hot_table()
+    test_reads_merge_archived_and_hot_rows()
+    test_only_the_lease_holder_archives_in_the_background()
+    print("✓ Archive tests passed")
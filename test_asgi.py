@@ -0,0 +1,68 @@
+import multiprocessing
+import os
+import shutil
+import uuid
+
+import pytest
+
+# The ASGI deployment needs the packages from requirements-async.txt
+for module in ('a2wsgi', 'aiosqlite', 'httpx'):
+    pytest.importorskip(module)
+
+
+def run_app(database_url, results):
+    """Register a visitor through asgi.app and read it back through the Flask routes"""
+    os.environ.update(DATABASE_URL=database_url, NOTIFICATION_SERVICE='console',
+                      SECURITY_NOTIFICATION_SERVICE='console')
+    import asyncio
+
+    import httpx
+
+    import asgi
+    import main
+
+    async def requests():
+        transport = httpx.ASGITransport(app=asgi.app)
+        async with httpx.AsyncClient(transport=transport, base_url='http://testserver') as client:
+            registered = await client.post('/api/visitors', json={
+                'name': '访客', 'phone': '13800138000', 'company': '测试公司',
+                'host_name': '被拜访人', 'host_company': '接待单位', 'host_phone': '13900139000',
+            })
+            listing = await client.get('/api/visitors')
+            return registered.status_code, registered.json(), listing.json()
+
+    try:
+        status, registered, listing = asyncio.run(requests())
+        results.put((main.app.instance_path, status, registered, listing))
+    except Exception as e:
+        results.put((main.app.instance_path, None, repr(e), None))
+
+
+def test_registration_uses_the_flask_database_for_a_relative_sqlite_url():
+    # Relative, so Flask-SQLAlchemy puts it under the instance folder
+    filename = f'test-asgi-{uuid.uuid4().hex}.db'
+    context = multiprocessing.get_context('spawn')
+    results = context.Queue()
+    process = context.Process(target=run_app, args=(f'sqlite:///{filename}', results))
+    process.start()
+    instance_path, status, registered, listing = results.get(timeout=60)
+    process.join(timeout=30)
+
+    # Where the database ended up: the instance folder, as for Flask, or the working directory
+    created = {directory: os.path.exists(os.path.join(directory, filename))
+               for directory in (instance_path, os.getcwd())}
+    for directory in created:
+        for suffix in ('', '-wal', '-shm'):
+            path = os.path.join(directory, filename + suffix)
+            if os.path.exists(path):
+                os.remove(path)
+    if os.path.isdir(instance_path) and not os.listdir(instance_path):
+        shutil.rmtree(instance_path)
+
+    assert status == 201, registered
+    assert [visitor['id'] for visitor in listing] == [registered['id']]
+    assert created == {instance_path: True, os.getcwd(): False}
+
+
+if __name__ == "__main__":
+    raise SystemExit(pytest.main([__file__, '-q']))
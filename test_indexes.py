@@ -0,0 +1,82 @@
+import os
+import tempfile
+
+# Point the app at a throwaway database before it is imported
+os.environ['DATABASE_URL'] = 'sqlite:///' + os.path.join(tempfile.mkdtemp(), 'visitors.db')
+
+from datetime import datetime
+
+from sqlalchemy import create_engine, text
+
+import main
+
+
+def explain(engine, query):
+    """Return SQLite's EXPLAIN QUERY PLAN details for an ORM query"""
+    compiled = query.statement.compile(dialect=engine.dialect)
+    params = tuple(
+        value.isoformat(' ') if isinstance(value, datetime) else value
+        for value in (compiled.params[name] for name in compiled.positiontup)
+    )
+    with engine.connect() as conn:
+        rows = conn.exec_driver_sql('EXPLAIN QUERY PLAN ' + str(compiled), params).fetchall()
+    return [row[-1] for row in rows]
+
+
+def legacy_engine():
+    """A database created before the indexes were declared"""
+    engine = create_engine('sqlite://')
+    main.Visitor.__table__.create(engine)
+    with engine.begin() as conn:
+        for index in main.Visitor.__table__.indexes:
+            conn.execute(text(f'DROP INDEX {index.name}'))
+    return engine
+
+
+def test_create_missing_indexes_on_existing_database():
+    engine = legacy_engine()
+
+    created = main.create_missing_indexes(engine)
+
+    assert sorted(created) == sorted(index.name for index in main.Visitor.__table__.indexes)
+    assert main.create_missing_indexes(engine) == []
+
+
+def test_hot_queries_use_index_scans():
+    engine = legacy_engine()
+    main.create_missing_indexes(engine)
+
+    hot_queries = {
+        'newest first': ({}, 'ix_visitor_visit_time_id'),
+        'pending for host page': ({'status': 'pending'}, 'ix_visitor_status_visit_time'),
+        'by host phone': ({'host_phone': '13900139000'}, 'ix_visitor_host_phone_visit_time'),
+        'next page': ({'cursor': (datetime(2026, 1, 1), 100)}, 'ix_visitor_visit_time_id'),
+    }
+    with main.app.app_context():
+        for name, (filters, index_name) in hot_queries.items():
+            plan = explain(engine, main.visitor_listing_query(**filters).limit(100))
+            print(f"{name}: {plan}")
+            assert any(index_name in step for step in plan), f'{name} does not use {index_name}: {plan}'
+            assert not any(step.startswith('SCAN visitor') and 'INDEX' not in step for step in plan), \
+                f'{name} does a full table scan: {plan}'
+            assert not any('TEMP B-TREE' in step for step in plan), f'{name} sorts in memory: {plan}'
+
+
+def test_host_pending_queue_uses_index():
+    engine = legacy_engine()
+    main.create_missing_indexes(engine)
+
+    with main.app.app_context():
+        query = (main.Visitor.query
+                 .filter(main.Visitor.host_phone == '13900139000', main.Visitor.status == 'pending')
+                 .order_by(main.Visitor.visit_time, main.Visitor.id))
+        plan = explain(engine, query)
+    print(f"host pending queue: {plan}")
+    assert plan == ['SEARCH visitor USING INDEX ix_visitor_host_phone_status_visit_time (host_phone=? AND status=?)']
+
+
+if __name__ == "__main__":
+    test_create_missing_indexes_on_existing_database()
+    test_hot_queries_use_index_scans()
+    test_host_pending_queue_uses_index()
+    print("✓ Index tests passed")
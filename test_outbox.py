@@ -0,0 +1,198 @@
+import os
+import tempfile
+
+# Point the app at a throwaway database before it is imported
+os.environ['DATABASE_URL'] = 'sqlite:///' + os.path.join(tempfile.mkdtemp(), 'visitors.db')
+
+import json
+from datetime import datetime, timedelta
+
+import main
+from main import NotificationOutbox, db
+from notifications import CallbackChannel
+
+
+def add_row(**values):
+    """Insert one outbox row directly and return its id"""
+    with main.app.app_context():
+        row = NotificationOutbox(**dict({'audience': 'host', 'channel': 'test', 'message': '有新的访客预约',
+                                         'payload': json.dumps({'visitor_id': 1})}, **values))
+        db.session.add(row)
+        db.session.commit()
+        return row.id
+
+
+def load(outbox_id):
+    with main.app.app_context():
+        row = db.session.get(NotificationOutbox, outbox_id)
+        db.session.expunge(row)
+        return row
+
+
+def claim(outbox_id):
+    with main.app.app_context():
+        claimed = db.session.execute(main.outbox_relay.claim(outbox_id)).rowcount
+        db.session.commit()
+        return claimed
+
+
+def fake_sender(monkeypatch, outcomes):
+    """Replace the real channels with canned (outcome, error) results; returns the calls made"""
+    calls = []
+
+    def send_to(audience, channel_name, message, payload):
+        calls.append((audience, channel_name, payload))
+        return outcomes.pop(0)
+
+    monkeypatch.setattr(main.notifiers, 'send_to', send_to)
+    return calls
+
+
+def test_a_due_row_is_claimed_only_once():
+    outbox_id = add_row()
+
+    assert claim(outbox_id) == 1
+    assert claim(outbox_id) == 0
+
+    row = load(outbox_id)
+    assert row.status == 'sending'
+    assert row.attempts == 1
+    # Leased, so the poller leaves it alone while the send is in flight
+    assert row.next_attempt_at > datetime.utcnow() + timedelta(seconds=main.outbox_relay.lease - 5)
+
+
+def test_rows_not_yet_due_are_not_claimed():
+    outbox_id = add_row(next_attempt_at=datetime.utcnow() + timedelta(minutes=5))
+
+    assert claim(outbox_id) == 0
+    with main.app.app_context():
+        assert outbox_id not in db.session.execute(main.outbox_relay.due()).scalars().all()
+
+
+def test_an_expired_lease_is_claimed_again():
+    # A worker died mid-send: the row is left 'sending' with a lease in the past
+    outbox_id = add_row(status='sending', attempts=1, next_attempt_at=datetime.utcnow() - timedelta(seconds=1))
+
+    with main.app.app_context():
+        assert outbox_id in db.session.execute(main.outbox_relay.due()).scalars().all()
+    assert claim(outbox_id) == 1
+    assert load(outbox_id).attempts == 2
+
+
+def test_failed_send_is_retried_with_backoff_then_sent(monkeypatch):
+    calls = fake_sender(monkeypatch, [('http_error', 'HTTP 500'), ('success', None)])
+    outbox_id = add_row()
+
+    main.outbox_relay.deliver(outbox_id)
+    row = load(outbox_id)
+    assert row.status == 'pending'
+    assert row.last_error == 'HTTP 500'
+    # First retry: between half and all of base_delay from now
+    delay = (row.next_attempt_at - datetime.utcnow()).total_seconds()
+    assert main.outbox_relay.base_delay / 2 - 1 <= delay <= main.outbox_relay.base_delay
+
+    # Not due yet, so a second delivery attempt does nothing
+    main.outbox_relay.deliver(outbox_id)
+    assert len(calls) == 1
+
+    with main.app.app_context():
+        db.session.get(NotificationOutbox, outbox_id).next_attempt_at = datetime.utcnow()
+        db.session.commit()
+    main.outbox_relay.deliver(outbox_id)
+    row = load(outbox_id)
+    assert (row.status, row.attempts, row.last_error) == ('sent', 2, None)
+    assert row.sent_at is not None
+    assert calls == [('host', 'test', {'visitor_id': 1})] * 2
+
+
+def test_no_transaction_is_open_while_sending(monkeypatch):
+    in_transaction = []
+
+    def send_to(audience, channel_name, message, payload):
+        in_transaction.append(db.session().in_transaction())
+        return 'success', None
+
+    monkeypatch.setattr(main.notifiers, 'send_to', send_to)
+    outbox_id = add_row()
+
+    main.outbox_relay.deliver(outbox_id)
+
+    assert in_transaction == [False]
+    assert load(outbox_id).status == 'sent'
+
+
+def test_row_fails_after_max_attempts(monkeypatch):
+    fake_sender(monkeypatch, [('error', 'connection refused')])
+    outbox_id = add_row(attempts=main.outbox_relay.max_attempts - 1)
+
+    main.outbox_relay.deliver(outbox_id)
+
+    row = load(outbox_id)
+    assert (row.status, row.attempts, row.last_error) == \
+        ('failed', main.outbox_relay.max_attempts, 'connection refused')
+
+
+def test_retry_delay_grows_exponentially_up_to_the_cap():
+    relay = main.OutboxRelay(base_delay=2, max_delay=60)
+    for attempts, full in [(1, 2), (2, 4), (3, 8), (6, 60), (20, 60)]:
+        for _ in range(20):
+            assert full / 2 <= relay.retry_delay(attempts) <= full
+
+
+def test_purge_removes_only_old_finished_rows():
+    old = datetime.utcnow() - timedelta(days=main.outbox_relay.retention_days + 1)
+    old_sent = add_row(status='sent', sent_at=old)
+    old_merged = add_row(status='merged', sent_at=old)
+    recent_sent = add_row(status='sent', sent_at=datetime.utcnow())
+    old_failed = add_row(status='failed', created_at=old)
+
+    with main.app.app_context():
+        db.session.execute(main.outbox_relay.purge(), execution_options={'synchronize_session': False})
+        db.session.commit()
+        remaining = set(db.session.execute(db.select(NotificationOutbox.id)).scalars())
+
+    assert old_sent not in remaining and old_merged not in remaining
+    assert {recent_sent, old_failed} <= remaining
+
+
+def test_digest_merges_the_held_rows_of_its_visitors(monkeypatch):
+    monkeypatch.setattr(main.notifiers, 'channels', lambda audience: [CallbackChannel('test', None)])
+    kicked = []
+    monkeypatch.setattr(main.outbox_relay, 'kick', kicked.extend)
+
+    items = []
+    with main.app.app_context():
+        for index in range(2):
+            visitor = main.Visitor(name=f'访客{index}', phone='13800138000', company='测试公司',
+                                   host_name='被拜访人', host_company='接待单位', host_phone='13900139000')
+            db.session.add(visitor)
+            db.session.flush()
+            outbox_ids = main.outbox_relay.enqueue('host', *main.host_notification(visitor), hold=300)
+            db.session.commit()
+            items.append((main.detached_copy(visitor), outbox_ids))
+    held_ids = [outbox_id for _, outbox_ids in items for outbox_id in outbox_ids]
+
+    # Held rows are written at registration time but are not due yet
+    with main.app.app_context():
+        due = db.session.execute(main.outbox_relay.due()).scalars().all()
+    assert not set(held_ids) & set(due)
+
+    main.send_host_digest('13900139000', items)
+
+    assert [load(outbox_id).status for outbox_id in held_ids] == ['merged', 'merged']
+    digest = load(kicked[0])
+    assert digest.status == 'pending' and digest.next_attempt_at <= datetime.utcnow()
+    assert [v['visitor_id'] for v in json.loads(digest.payload)['visitors']] == [v.id for v, _ in items]
+
+    # A lone visitor's held row is released as is
+    kicked.clear()
+    held_id = add_row(next_attempt_at=datetime.utcnow() + timedelta(seconds=300))
+    main.send_host_digest('13900139000', [(items[0][0], [held_id])])
+    assert kicked == [held_id]
+    row = load(held_id)
+    assert row.status == 'pending' and row.next_attempt_at <= datetime.utcnow()
+
+
+if __name__ == "__main__":
+    import pytest
+    raise SystemExit(pytest.main([__file__, '-q']))
@@ -0,0 +1,65 @@
+import os
+import tempfile
+
+# Point the app at a throwaway database before it is imported
+os.environ['DATABASE_URL'] = 'sqlite:///' + os.path.join(tempfile.mkdtemp(), 'visitors.db')
+
+import pytest
+from sqlalchemy import create_engine
+from sqlalchemy.exc import OperationalError
+
+import main
+from main import Visitor, VisitorArchive, db
+
+
+def seed_visitors(count):
+    with main.app.app_context():
+        db.session.query(Visitor).delete()
+        db.session.query(VisitorArchive).delete()
+        db.session.add_all(Visitor(name=f'访客{index}', phone='13800138000', company='测试公司',
+                                   host_name='被拜访人', host_company='接待单位', host_phone='13900139000')
+                           for index in range(count))
+        db.session.commit()
+
+
+def use_replica(monkeypatch, url):
+    """Route @read_replica views to a replica engine at ``url``; returns its router"""
+    router = main.ReplicaRouter(True)
+    monkeypatch.setattr(main, 'replica_router', router)
+    with main.app.app_context():
+        monkeypatch.setitem(db.engines, 'replica', create_engine(url))
+    return router
+
+
+def test_exports_fall_back_to_the_primary_when_the_replica_is_unreachable(monkeypatch):
+    seed_visitors(3)
+    router = use_replica(monkeypatch, 'sqlite:////nonexistent/dir/replica.db')
+    client = main.app.test_client()
+
+    response = client.get('/api/visitors/export?format=ndjson')
+    assert response.status_code == 200
+    assert len(response.get_data(as_text=True).splitlines()) == 3
+    assert router.stats()['available'] is False
+    assert router.stats()['fallbacks'] == 1
+
+    # Later requests go straight to the primary until the retry interval is over
+    rows = client.get('/api/visitors/export').get_data(as_text=True).splitlines()
+    assert len(rows) == 4
+    assert router.stats()['primary'] == 2 and router.stats()['replica'] == 0
+
+
+def test_error_in_the_middle_of_a_stream_marks_the_replica_down(monkeypatch):
+    seed_visitors(3)
+    # Reachable, but without the tables: fails only once the export queries
+    router = use_replica(monkeypatch, 'sqlite:///' + os.path.join(tempfile.mkdtemp(), 'replica.db'))
+    client = main.app.test_client()
+
+    with pytest.raises(OperationalError):
+        client.get('/api/visitors/export?format=ndjson').get_data()
+
+    assert router.stats()['available'] is False
+    assert len(client.get('/api/visitors/export?format=ndjson').get_data(as_text=True).splitlines()) == 3
+
+
+if __name__ == "__main__":
+    raise SystemExit(pytest.main([__file__, '-q']))
@@ -0,0 +1,74 @@
+import os
+import tempfile
+
+# Point the app at a throwaway database before it is imported
+os.environ['DATABASE_URL'] = 'sqlite:///' + os.path.join(tempfile.mkdtemp(), 'visitors.db')
+
+import json
+
+from sqlalchemy import event, inspect, text
+
+import main
+from main import SecurityNotification, db
+
+
+def test_legacy_overflow_table_is_migrated_and_dropped():
+    with main.app.app_context():
+        db.session.query(SecurityNotification).delete()
+        db.session.execute(text('CREATE TABLE security_notification (id INTEGER PRIMARY KEY, '
+                                'event_id INTEGER NOT NULL, timestamp VARCHAR(32) NOT NULL, payload TEXT NOT NULL)'))
+        for event_id in (2, 1):
+            data = {'visitor_name': f'访客{event_id}', 'status': 'approved',
+                    'timestamp': f'2026-01-0{event_id}T09:00:00', 'event_id': event_id}
+            db.session.execute(text('INSERT INTO security_notification (event_id, timestamp, payload) '
+                                    'VALUES (:event_id, :timestamp, :payload)'),
+                               {'event_id': event_id, 'timestamp': data['timestamp'],
+                                'payload': json.dumps(data, ensure_ascii=False)})
+        db.session.commit()
+
+        assert main.migrate_legacy_security_feed() == 2
+        assert not inspect(db.engine).has_table('security_notification')
+        assert main.migrate_legacy_security_feed() == 0
+
+    # Newest first, with event ids from the shared feed and nothing duplicated
+    feed = main.app.test_client().get('/api/security/notifications').get_json()
+    assert [entry['visitor_name'] for entry in feed] == ['访客2', '访客1']
+    assert [entry['event_id'] for entry in feed] == sorted((entry['event_id'] for entry in feed), reverse=True)
+
+
+
+def test_append_locks_the_feed_counter_before_taking_an_id():
+    statements = []
+
+    def record(conn, cursor, statement, parameters, context, executemany):
+        statements.append(statement.split()[0:3])
+
+    with main.app.app_context():
+        engine = db.engine
+    event.listen(engine, 'before_cursor_execute', record)
+    try:
+        main.security_notifications.append({'visitor_name': '访客', 'status': 'approved'})
+    finally:
+        event.remove(engine, 'before_cursor_execute', record)
+
+    writes = [words for words in statements if words[0] in ('UPDATE', 'INSERT')]
+    assert writes == [['UPDATE', 'data_version', 'SET'], ['INSERT', 'INTO', 'security_feed']]
+
+
+def test_every_append_changes_the_feed_etag():
+    client = main.app.test_client()
+    etag = client.get('/api/security/notifications').headers['ETag']
+
+    main.security_notifications.append({'visitor_name': '访客', 'status': 'approved'})
+
+    response = client.get('/api/security/notifications', headers={'If-None-Match': etag})
+    assert response.status_code == 200
+    assert client.get('/api/security/notifications',
+                      headers={'If-None-Match': response.headers['ETag']}).status_code == 304
+
+
+if __name__ == "__main__":
+    test_legacy_overflow_table_is_migrated_and_dropped()
+    test_append_locks_the_feed_counter_before_taking_an_id()
+    test_every_append_changes_the_feed_etag()
+    print("✓ Security feed migration test passed")
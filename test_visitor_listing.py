@@ -0,0 +1,120 @@
+import os
+import tempfile
+
+# Point the app at a throwaway database before it is imported
+os.environ['DATABASE_URL'] = 'sqlite:///' + os.path.join(tempfile.mkdtemp(), 'visitors.db')
+
+from datetime import datetime, timedelta
+from urllib.parse import parse_qs, urlsplit
+
+import main
+
+START = datetime(2026, 3, 1, 9, 0)
+
+
+def seed_visitors():
+    """25 visitors, two per minute (same visit_time, so ids break the tie), two hosts"""
+    with main.app.app_context():
+        main.db.session.query(main.Visitor).delete()
+        main.db.session.query(main.VisitorArchive).delete()
+        visitors = [
+            main.Visitor(name=f'访客{index}', phone='13800138000', company='测试公司',
+                         host_name='被拜访人', host_company='接待单位',
+                         host_phone='13900139000' if index % 2 else '13900139001',
+                         status='approved' if index % 3 == 0 else 'pending',
+                         visit_time=START + timedelta(minutes=index // 2))
+            for index in range(25)
+        ]
+        main.db.session.add_all(visitors)
+        main.db.session.commit()
+        return [(v.id, v.visit_time, v.status, v.host_phone) for v in visitors]
+
+
+def newest_first(rows):
+    return [row[0] for row in sorted(rows, key=lambda row: (row[1], row[0]), reverse=True)]
+
+
+def fetch_all_pages(client, query):
+    """Follow X-Next-Cursor until the last page; returns (ids, number of pages)"""
+    ids, pages, url = [], 0, f'/api/visitors?{query}'
+    while True:
+        response = client.get(url)
+        assert response.status_code == 200, response.get_json()
+        ids.extend(visitor['id'] for visitor in response.get_json())
+        pages += 1
+        cursor = response.headers.get('X-Next-Cursor')
+        if cursor is None:
+            assert 'Link' not in response.headers
+            return ids, pages
+        url = f'/api/visitors?{query}&cursor={cursor}'
+
+
+def test_pages_follow_the_cursor_without_gaps_or_repeats():
+    rows = seed_visitors()
+    client = main.app.test_client()
+
+    ids, pages = fetch_all_pages(client, 'limit=10')
+
+    assert ids == newest_first(rows)
+    assert pages == 3
+
+
+def test_link_header_points_at_the_next_page_with_the_same_filters():
+    seed_visitors()
+    client = main.app.test_client()
+
+    response = client.get('/api/visitors?limit=2&status=pending')
+    link = response.headers['Link']
+    assert link.endswith('>; rel="next"')
+    query = parse_qs(urlsplit(link[1:link.index('>')]).query)
+    assert query == {'limit': ['2'], 'status': ['pending'], 'cursor': [response.headers['X-Next-Cursor']]}
+
+    next_page = client.get(link[1:link.index('>')]).get_json()
+    first_page = response.get_json()
+    assert not {v['id'] for v in first_page} & {v['id'] for v in next_page}
+
+
+def test_filters_are_applied_on_every_page():
+    rows = seed_visitors()
+    client = main.app.test_client()
+
+    ids, _ = fetch_all_pages(client, 'limit=3&status=approved&host_phone=13900139000')
+    assert ids == newest_first([row for row in rows if row[2] == 'approved' and row[3] == '13900139000'])
+
+    since, until = START + timedelta(minutes=3), START + timedelta(minutes=7)
+    ids, _ = fetch_all_pages(client, f'limit=4&since={since.isoformat()}&until={until.isoformat()}')
+    assert ids == newest_first([row for row in rows if since <= row[1] < until])
+
+
+def test_limit_is_capped_at_the_maximum_page_size():
+    seed_visitors()
+    client = main.app.test_client()
+
+    response = client.get(f'/api/visitors?limit={main.MAX_PAGE_SIZE + 1000}')
+    assert response.status_code == 200
+    assert len(response.get_json()) == 25
+    assert 'X-Next-Cursor' not in response.headers
+
+
+def test_bad_parameters_are_rejected():
+    client = main.app.test_client()
+
+    for query, error in [
+        ('limit=abc', 'limit must be an integer'),
+        ('limit=0', 'limit must be positive'),
+        ('cursor=not-a-cursor', 'invalid cursor'),
+        ('since=yesterday', 'since must be an ISO 8601 date or datetime'),
+        ('until=2026-13-01', 'until must be an ISO 8601 date or datetime'),
+    ]:
+        response = client.get(f'/api/visitors?{query}')
+        assert response.status_code == 400, query
+        assert response.get_json() == {'error': error}
+
+
+if __name__ == "__main__":
+    test_pages_follow_the_cursor_without_gaps_or_repeats()
+    test_link_header_points_at_the_next_page_with_the_same_filters()
+    test_filters_are_applied_on_every_page()
+    test_limit_is_capped_at_the_maximum_page_size()
+    test_bad_parameters_are_rejected()
+    print("✓ Visitor listing tests passed")